@@ -0,0 +1,75 @@
+"""
+Oppstartstid for moduler og korte kommandoer.
+
+Hver kommando kjøres i en ny Python-prosess uten legitimasjon i miljøet (psql_psw,
+API-nøkler, OCRACLE_JSON_PATH), så målingen viser også at import ikke krever dem.
+Etter import av exam_pipeline skrives tunge moduler som likevel ble lastet.
+
+    python benchmarks/bench_startup.py [--repeat 10]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+COMMANDS = {
+    "python (baseline)": ["-c", "pass"],
+    "import prompt_llm": ["-c", "import prompt_llm"],
+    "import ocr": ["-c", "import ocr"],
+    "import exam_pipeline": ["-c", "import exam_pipeline"],
+    "exam_pipeline catalog TMA4100": ["exam_pipeline.py", "catalog", "TMA4100"],
+}
+
+HEAVY_MODULES = [
+    "openai", "fitz", "pymupdf", "PIL", "pytesseract", "tkinter",
+    "google.cloud.vision", "sqlalchemy", "psycopg2",
+]
+
+CREDENTIAL_VARS = ["psql_psw", "GROQ_API_KEY", "OPENAI_API_KEY", "OCRACLE_JSON_PATH", "GOOGLE_APPLICATION_CREDENTIALS"]
+
+
+def clean_env() -> dict:
+    env = {k: v for k, v in os.environ.items() if k not in CREDENTIAL_VARS}
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+
+def time_command(args: list[str], repeat: int) -> list[float]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=ROOT, env=clean_env(), check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def loaded_heavy_modules() -> list[str]:
+    code = (
+        "import sys, exam_pipeline; "
+        f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=clean_env(), check=True, capture_output=True, text=True)
+    return out.stdout.split()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'command':<32} {'median ms':>10} {'min ms':>8}")
+    for name, command in COMMANDS.items():
+        times = time_command(command, args.repeat)
+        print(f"{name:<32} {statistics.median(times) * 1000:>10.1f} {min(times) * 1000:>8.1f}")
+
+    heavy = loaded_heavy_modules()
+    print(f"\nHeavy modules loaded by 'import exam_pipeline': {', '.join(heavy) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import os
+import re
+
+from subject_catalog import get_catalog
+
+# Av som standard til benchmarks/bench_context.py har vist at utdraget gir samme felt som hele teksten
+CONTEXT_SELECTION = os.getenv("LLM_CONTEXT_SELECTION", "0") == "1"
+
+# Maks antall tegn i utdraget per felt. "metadata" er JSON-kallet som henter alle feltene.
+CONTEXT_BUDGETS = {
+    "metadata": int(os.getenv("LLM_CONTEXT_BUDGET", 4000)),
+    "subject_code": 1500,
+    "subject_name": 1500,
+    "assessment_type": 2000,
+    "exam_date": 1500,
+    "assignment_number": 1500,
+    "lang": 1500,
+}
+
+MONTHS = "jan|feb|mar|apr|mai|may|jun|jul|aug|sep|okt|oct|nov|des|dec"
+CODE_RE = re.compile(r"\b[A-ZÆØÅ]{2,6}\d{3,6}[A-Z]?\b")
+DATE_RE = re.compile(
+    rf"\b\d{{4}}-\d{{2}}-\d{{2}}\b"
+    rf"|\b\d{{1,2}}[./]\s?\d{{1,2}}[./]\s?\d{{2,4}}\b"
+    rf"|\b\d{{1,2}}\.?\s+(?:{MONTHS})\w*\.?\s+\d{{4}}\b",
+    re.IGNORECASE
+)
+
+# (mønster, vekt) per felt; antall treff per blokk telles opp til 3
+FIELD_PATTERNS = {
+    "subject_code": [
+        (CODE_RE, 2.0),
+        (re.compile(r"emnekode|course code|subject code|fagkode", re.IGNORECASE), 1.0),
+    ],
+    "subject_name": [
+        (CODE_RE, 1.5),
+        (re.compile(r"\bemne|course|subject|\bfag\b", re.IGNORECASE), 1.0),
+    ],
+    "assessment_type": [
+        (re.compile(r"eksamen|exam|øving|assignment|innlevering|oblig", re.IGNORECASE), 1.0),
+    ],
+    "exam_date": [
+        (DATE_RE, 2.0),
+        (re.compile(r"dato|date|klokkeslett|time:|tid:", re.IGNORECASE), 1.0),
+    ],
+    "assignment_number": [
+        (re.compile(r"(?:øving|assignment|oblig\w*|innlevering|exercise)\s*(?:nr\.?|no\.?)?\s*\d{1,2}\b", re.IGNORECASE), 2.0),
+    ],
+    "lang": [],
+}
+CATALOG_HIT_WEIGHT = 3.0
+
+
+class ContextSelector:
+    """
+    Velger ut de mest relevante tekstblokkene for hvert LLM-felt i stedet for å sende
+    hele eksamensteksten. Kode, dato og språk står nesten alltid på forsiden, så blokker
+    rangeres etter posisjon (tidlige sider, høyt oppe på siden) og treff på mønstre for
+    feltet (emnekoder fra katalogen, datoer, "Øving 3" osv.).
+
+    blocks er (page_number, bbox, text). Utdraget fylles med de høyest rangerte blokkene
+    til budsjettet er brukt opp og skrives i leserekkefølge.
+    """
+
+    def __init__(self, blocks: list[tuple[int, list[float], str]]):
+        self.blocks = [(page_number, bbox, text) for page_number, bbox, text in blocks if text.strip()]
+        self._page_bottoms: dict[int, float] = {}
+        for page_number, bbox, _ in self.blocks:
+            self._page_bottoms[page_number] = max(self._page_bottoms.get(page_number, 0.0), bbox[3])
+        self._scores = [self._score_block(i) for i in range(len(self.blocks))]
+
+    def _score_block(self, i: int) -> dict[str, float]:
+        page_number, bbox, text = self.blocks[i]
+        page_bottom = self._page_bottoms[page_number] or 1.0
+        position = 2.0 / (1 + page_number) + (1.0 - min(1.0, bbox[1] / page_bottom))
+
+        catalog = get_catalog()
+        catalog_hits = sum(code in catalog.by_code for code in set(CODE_RE.findall(text)))
+
+        scores = {}
+        for field, patterns in FIELD_PATTERNS.items():
+            score = position
+            for pattern, weight in patterns:
+                score += weight * min(3, len(pattern.findall(text)))
+            if field in ("subject_code", "subject_name"):
+                score += CATALOG_HIT_WEIGHT * min(2, catalog_hits)
+            if field == "lang" and len(text) > 200:
+                score += 1.0  # språk gjenkjennes best i løpende tekst
+            scores[field] = score
+        scores["metadata"] = sum(scores.values())
+        return scores
+
+    def excerpt(self, field: str, budget: int | None = None) -> str:
+        budget = budget or CONTEXT_BUDGETS[field]
+
+        ranked = sorted(range(len(self.blocks)), key=lambda i: -self._scores[i][field])
+        selected, used = [], 0
+        for i in ranked:
+            text = self.blocks[i][2]
+            if used + len(text) > budget:
+                if selected:
+                    continue
+                text = text[:budget]  # én blokk som alene er større enn budsjettet
+            selected.append((i, text))
+            used += len(text)
+            if used >= budget:
+                break
+
+        selected.sort(key=lambda item: (self.blocks[item[0]][0], self.blocks[item[0]][1][1]))
+        return "\n".join(text for _, text in selected)
+
+    def excerpts(self) -> dict[str, str]:
+        return {field: self.excerpt(field) for field in CONTEXT_BUDGETS}
@@ -1,16 +1,22 @@
 from datetime import date
 import sqlalchemy
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String
 from sqlalchemy import Integer, String, Boolean, Float, Text, ForeignKey, Date
 from typing import get_origin, get_type_hints
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
 import typing
+import asyncio
+import threading
+from contextlib import contextmanager
+import hashlib
+import weakref
 
 
 import psycopg2
 from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
 
 import logging
 
@@ -22,14 +28,209 @@ TYPE_MAP = {
     date: Date,
 }
 
+def _serialize_list(value):
+    return ",".join(map(str, value)) if value is not None else None
+
+def _serialize_foreign_key(value):
+    return getattr(value, "id", None)
+
+def _serialize_value(value):
+    return value
+
+
+class ClassSchema:
+    """
+    Ferdig kompilert beskrivelse av hvordan en klasse lagres, beregnet én gang per klasse:
+    tabellnavn, kolonne og serializer per attributt, og kolonnene som settes inn.
+    Følger samme regler som create_table.
+    """
+
+    def __init__(self, cls: type):
+        self.cls = cls
+        self.table_name = cls.__name__.lower()
+        self.type_hints = get_type_hints(cls)
+
+        # attr -> (kolonnenavn, serializer)
+        self.fields: dict[str, tuple[str, typing.Callable]] = {}
+
+        for attr, py_type in self.type_hints.items():
+            # Primary key håndteres ikke her
+            if attr == "id":
+                continue
+
+            # list[...] → Text
+            if get_origin(py_type) is list:
+                self.fields[attr] = (attr, _serialize_list)
+
+            # Foreign key (klasse med __annotations__)
+            elif isinstance(py_type, type) and hasattr(py_type, "__annotations__"):
+                self.fields[attr] = (f"{py_type.__name__.lower()}_id", _serialize_foreign_key)
+
+            # Vanlig kolonne
+            else:
+                self.fields[attr] = (attr, _serialize_value)
+
+        self.insert_attrs = [attr for attr in self.fields if attr not in DB.SKIP_ATTRS]
+        self.insert_columns = [self.fields[attr][0] for attr in self.insert_attrs]
+
+    def column_and_value(self, attr: str, value):
+        # id gir (None, None) og hoppes over av kallerne; ukjente attributter er en feil,
+        # så en skrivefeil ikke stille forsvinner fra WHERE
+        if attr == "id":
+            return None, None
+        if attr not in self.fields:
+            raise KeyError(f"{self.cls.__name__} has no stored attribute {attr!r}")
+        column, serialize = self.fields[attr]
+        return column, serialize(value)
+
+    def insert_values(self, obj) -> list:
+        values = []
+        for attr in self.insert_attrs:
+            _, serialize = self.fields[attr]
+            values.append(serialize(getattr(obj, attr, None)))
+        return values
+
+
 class DB:
-    def __init__(self, database_url: str):
-        self.connection = psycopg2.connect(database_url)
-        self.connection.autocommit = True
+    def __init__(self, database_url: str, min_connections: int = 1, max_connections: int = 10):
+        # Hver operasjon låner en tilkobling fra poolen, så DB kan deles mellom tråder
+        self.pool = ThreadedConnectionPool(min_connections, max_connections, database_url)
+        # ThreadedConnectionPool kaster PoolError når den er tom; semaforen lar i stedet
+        # tråder vente på en ledig tilkobling
+        self._available = threading.BoundedSemaphore(max_connections)
+        self._local = threading.local()
 
         self.engine = create_engine(database_url)
         self.metadata = MetaData()
 
+        self._schemas: dict[type, ClassSchema] = {}
+        # (generasjon, navn på server-side prepared statements) per tilkobling
+        self._prepared: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._prepared_lock = threading.Lock()
+        self._statement_generation = 0
+
+    @contextmanager
+    def checkout(self):
+        """
+        Låner en tilkobling (autocommit) fra poolen for varigheten av with-blokken.
+        """
+        self._available.acquire()
+        try:
+            conn = self.pool.getconn()
+            try:
+                conn.autocommit = True
+                yield conn
+            finally:
+                self.pool.putconn(conn)
+        finally:
+            self._available.release()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Eksplisitt transaksjon: alle DB-kall fra samme tråd inne i with-blokken bruker
+        samme tilkobling, og alt committes samlet til slutt (eller rulles tilbake ved feil).
+        Nøstede transaction()-blokker blir en del av den ytterste.
+        """
+        conn = getattr(self._local, "transaction", None)
+        if conn is not None:
+            yield conn
+            return
+
+        with self.checkout() as conn:
+            conn.autocommit = False
+            self._local.transaction = conn
+            try:
+                with conn:
+                    yield conn
+            finally:
+                self._local.transaction = None
+                conn.autocommit = True
+
+    @contextmanager
+    def cursor(self, cursor_factory=None):
+        """
+        Cursor på trådens aktive transaksjon, eller på en lånt autocommit-tilkobling.
+        """
+        conn = getattr(self._local, "transaction", None)
+        if conn is not None:
+            with conn.cursor(cursor_factory=cursor_factory) as cursor:
+                yield cursor
+            return
+
+        with self.checkout() as conn:
+            with conn.cursor(cursor_factory=cursor_factory) as cursor:
+                yield cursor
+
+    @property
+    def aio(self) -> "AsyncDB":
+        return AsyncDB(self)
+
+    def close(self) -> None:
+        self.pool.closeall()
+        self.engine.dispose()
+
+    def schema(self, cls: type) -> ClassSchema:
+        schema = self._schemas.get(cls)
+        if schema is None:
+            schema = self._schemas[cls] = ClassSchema(cls)
+        return schema
+
+    def _execute_prepared(self, cursor, query: sql.Composable, values: list) -> None:
+        """
+        Kjører query (med $1, $2, ... som plassholdere) som et prepared statement.
+        Statementet PREPARE-es første gang det brukes på en tilkobling, og gjenbrukes
+        deretter, slik at Postgres slipper å parse og planlegge samme spørring per rad.
+        Har skjemaet endret seg siden tilkoblingen sist ble brukt (_statement_generation),
+        kjøres DEALLOCATE ALL på den først.
+        """
+        query = query.as_string(cursor)
+        generation = self._statement_generation
+        name = f"stmt{generation}_" + hashlib.sha1(query.encode("utf-8")).hexdigest()[:16]
+
+        with self._prepared_lock:
+            entry = self._prepared.get(cursor.connection)
+            stale = entry is not None and entry[0] != generation
+            if entry is None or stale:
+                entry = self._prepared[cursor.connection] = (generation, set())
+        prepared = entry[1]
+        if stale:
+            cursor.execute("DEALLOCATE ALL")
+        if name not in prepared:
+            cursor.execute(f"PREPARE {name} AS {query}")
+            prepared.add(name)
+
+        if values:
+            cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(values))})", values)
+        else:
+            cursor.execute(f"EXECUTE {name}")
+
+    def query(self, query: sql.Composable, values: list) -> list[dict]:
+        """
+        Kjører en ferdig spørring (med $1, $2, ... som plassholdere) som prepared statement
+        og returnerer radene som dicts.
+        """
+        with self.cursor(cursor_factory=RealDictCursor) as cursor:
+            self._execute_prepared(cursor, query, values)
+            return cursor.fetchall()
+
+    def alter_schema(self, statements: list[str]) -> None:
+        """
+        Kjører DDL (indekser, genererte kolonner, extensions) i én transaksjon.
+        """
+        with self.transaction():
+            with self.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+
+        # Prepared statements med SELECT * er planlagt mot de gamle kolonnene, så de
+        # deallokeres på hver tilkobling neste gang den brukes
+        self._statement_generation += 1
+
+    @staticmethod
+    def _params(start: int, n: int) -> list[sql.SQL]:
+        return [sql.SQL(f"${i}") for i in range(start, start + n)]
+
     def create_table(self, cls) -> None:
         columns = []
 
@@ -62,40 +263,42 @@ class DB:
             
             # Handle basic types
             col_type = TYPE_MAP.get(py_type, Text)
-            columns.append(Column(attr, col_type))
+            columns.append(Column(attr, col_type, index=attr in DB.INDEXED_ATTRS))
 
         Table(table_name, self.metadata, *columns)
 
 
     def get_rows(self, cls, conditions: dict):
-        table_name = cls.__name__.lower()
-        type_hints = get_type_hints(cls)
+        schema = self.schema(cls)
 
         clauses = []
         values = []
 
         for attr, value in conditions.items():
-            py_type = type_hints[attr]
-
-            col, val = self._resolve_column_and_value(attr, py_type, value)
+            col, val = schema.column_and_value(attr, value)
             if col is None:
                 continue
-
             clauses.append(
-                sql.SQL("{} = %s").format(sql.Identifier(col))
+                sql.SQL("{} = {}").format(sql.Identifier(col), *self._params(len(values) + 1, 1))
             )
             values.append(val)
 
         query = sql.SQL("SELECT * FROM {} WHERE {}").format(
-            sql.Identifier(table_name),
+            sql.Identifier(schema.table_name),
             sql.SQL(" AND ").join(clauses)
         )
 
-        with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute(query, values)
+        with self.cursor(cursor_factory=RealDictCursor) as cursor:
+            self._execute_prepared(cursor, query, values)
             rows = cursor.fetchall()
             return rows
 
+    INDEXED_ATTRS = {
+        # oppslag som må være raske før noe tungt arbeid startes
+        "content_hash",
+        "text_fingerprint",
+    }
+
     SKIP_ATTRS = {
         # tunge PDF / OCR runtime-objekter
         "raw_page",
@@ -103,88 +306,85 @@ class DB:
     }
 
     def add_entity(self, obj) -> None:
-        table_name = obj.__class__.__name__.lower()
-        type_hints = get_type_hints(obj.__class__)
-
-        columns = []
-        values = []
+        schema = self.schema(obj.__class__)
+        values = schema.insert_values(obj)
 
-        for attr, py_type in type_hints.items():
-            if attr in DB.SKIP_ATTRS:
-                continue
-            col, val = self._resolve_column_and_value(
-                attr,
-                py_type,
-                getattr(obj, attr, None)
-            )
-            if col is None:
-                continue
-            columns.append(col)
-            values.append(val)
-
-        with self.connection.cursor() as cursor:
+        with self.cursor() as cursor:
             query = sql.SQL(
                 "INSERT INTO {} ({}) VALUES ({}) RETURNING id"
             ).format(
-                sql.Identifier(table_name),
-                sql.SQL(", ").join(map(sql.Identifier, columns)),
-                sql.SQL(", ").join(sql.Placeholder() * len(values))
+                sql.Identifier(schema.table_name),
+                sql.SQL(", ").join(map(sql.Identifier, schema.insert_columns)),
+                sql.SQL(", ").join(self._params(1, len(values)))
             )
 
-            cursor.execute(query, values)
+            self._execute_prepared(cursor, query, values)
             obj.id = cursor.fetchone()[0]
 
 
+    def add_entities(self, objs, page_size: int = 1000) -> None:
+        """
+        Setter inn mange objekter i én transaksjon med én multi-row INSERT ... RETURNING
+        per tabell (delt i sider på page_size rader), og setter obj.id på hvert objekt.
+
+        Objektene grupperes per klasse i rekkefølgen klassene først dukker opp, så foreldre
+        må komme før barna sine (f.eks. Exam, Pdf, Page, PdfBlock) for at fremmednøklene
+        skal ha id når barna settes inn.
+        """
+        groups: dict[type, list] = {}
+        for obj in objs:
+            groups.setdefault(obj.__class__, []).append(obj)
+
+        assigned = []
+        try:
+            with self.transaction():
+                with self.cursor() as cursor:
+                    for cls, group in groups.items():
+                        schema = self.schema(cls)
+                        rows = [schema.insert_values(obj) for obj in group]
+
+                        query = sql.SQL(
+                            "INSERT INTO {} ({}) VALUES %s RETURNING id"
+                        ).format(
+                            sql.Identifier(schema.table_name),
+                            sql.SQL(", ").join(map(sql.Identifier, schema.insert_columns))
+                        ).as_string(cursor)
+
+                        # Postgres returnerer RETURNING-radene i samme rekkefølge som VALUES
+                        ids = execute_values(cursor, query, rows, page_size=page_size, fetch=True)
+                        for obj, (obj_id,) in zip(group, ids):
+                            obj.id = obj_id
+                            assigned.append(obj)
+        except Exception:
+            # Transaksjonen er rullet tilbake, så id-ene finnes ikke lenger
+            for obj in assigned:
+                del obj.id
+            raise
+
+
     def set_values(self, obj, attrs: list[str]) -> None:
-        table_name = obj.__class__.__name__.lower()
-        type_hints = get_type_hints(obj.__class__)
+        schema = self.schema(obj.__class__)
 
         sets = []
         values = []
 
         for attr in attrs:
-            py_type = type_hints[attr]
-            value = getattr(obj, attr)
-
-            col, val = self._resolve_column_and_value(attr, py_type, value)
+            col, val = schema.column_and_value(attr, getattr(obj, attr))
             if col is None:
                 continue
-
-            sets.append(sql.SQL("{} = %s").format(sql.Identifier(col)))
+            sets.append(sql.SQL("{} = {}").format(sql.Identifier(col), *self._params(len(values) + 1, 1)))
             values.append(val)
 
         values.append(obj.id)
 
-        with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-            query = sql.SQL("UPDATE {} SET {} WHERE id = %s").format(
-                sql.Identifier(table_name),
-                sql.SQL(", ").join(sets)
+        with self.cursor(cursor_factory=RealDictCursor) as cursor:
+            query = sql.SQL("UPDATE {} SET {} WHERE id = {}").format(
+                sql.Identifier(schema.table_name),
+                sql.SQL(", ").join(sets),
+                *self._params(len(values), 1)
             )
-            cursor.execute(query, values)
-
-
-    def _resolve_column_and_value(self, attr: str, py_type, value):
-        """
-        Returnerer (column_name, sql_value) basert på samme regler som create_table
-        """
-        # Primary key håndteres ikke her
-        if attr == "id":
-            return None, None
-
-        origin = get_origin(py_type)
-
-        # list[...] → Text
-        if origin is list:
-            return attr, ",".join(map(str, value)) if value is not None else None
+            self._execute_prepared(cursor, query, values)
 
-        # Foreign key (klasse med __annotations__)
-        if isinstance(py_type, type) and hasattr(py_type, "__annotations__"):
-            ref_table = py_type.__name__.lower()
-            return f"{ref_table}_id", getattr(value, "id", None)
-
-        # Vanlig kolonne
-        return attr, value
-    
     def select_children(
         self,
         parent_cls,
@@ -211,10 +411,62 @@ class DB:
             {order_sql}
         """
 
-        with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
+        with self.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute(query, (parent_id,))
             return cursor.fetchall()
         
+    def load_tree(
+        self,
+        root_cls: type,
+        root_id: int,
+        children: list[type | tuple[type, list[str]]],
+    ) -> list[dict]:
+        """
+        Henter hele treet under en rad med én spørring per nivå, i stedet for én per forelder.
+
+        children er kjeden av barneklasser, eventuelt med kolonner å sortere på, f.eks.
+        [Pdf, (Page, ["page_number"]), (PdfBlock, ["block_number"])]. Returnerer radene på
+        første nivå; hver rad har barna sine, sortert, under nøkkelen "children".
+        """
+        root = {"id": root_id, "children": []}
+        parent_cls = root_cls
+        parents = {root_id: root}
+
+        with self.cursor(cursor_factory=RealDictCursor) as cursor:
+            for child in children:
+                child_cls, order_by = child if isinstance(child, tuple) else (child, [])
+                schema = self.schema(child_cls)
+
+                fk_cols = [
+                    schema.fields[attr][0] for attr, py_type in schema.type_hints.items()
+                    if py_type is parent_cls
+                ]
+                if not fk_cols:
+                    raise ValueError(f"{child_cls.__name__} has no reference to {parent_cls.__name__}.")
+                fk_col = fk_cols[0]
+
+                query = sql.SQL("SELECT * FROM {} WHERE {} = ANY({}) ORDER BY {}").format(
+                    sql.Identifier(schema.table_name),
+                    sql.Identifier(fk_col),
+                    *self._params(1, 1),
+                    sql.SQL(", ").join(map(sql.Identifier, [fk_col, *order_by, "id"]))
+                )
+                self._execute_prepared(cursor, query, [list(parents)])
+
+                rows = {}
+                for row in cursor.fetchall():
+                    row = dict(row)
+                    row["children"] = []
+                    parents[row[fk_col]]["children"].append(row)
+                    rows[row["id"]] = row
+
+                parent_cls = child_cls
+                parents = rows
+                if not parents:
+                    break
+
+        return root["children"]
+
     def create_relation_table(self, cls: type) -> None:
         Table(
             f"{cls.__name__.lower()}_relation",
@@ -231,21 +483,42 @@ class DB:
             print("Aborted.")
             return
 
-        with self.connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT tablename
-                FROM pg_tables
-                WHERE schemaname = 'public'
-            """)
-            tables = cursor.fetchall()
-
-            for (table,) in tables:
-                cursor.execute(
-                    sql.SQL("DROP TABLE IF EXISTS {} CASCADE")
-                    .format(sql.Identifier(table))
-                )
+        with self.transaction():
+            with self.cursor() as cursor:
+                cursor.execute("""
+                    SELECT tablename
+                    FROM pg_tables
+                    WHERE schemaname = 'public'
+                """)
+                tables = cursor.fetchall()
+
+                for (table,) in tables:
+                    cursor.execute(
+                        sql.SQL("DROP TABLE IF EXISTS {} CASCADE")
+                        .format(sql.Identifier(table))
+                    )
+
+        # Prepared statements på alle tilkoblingene peker på tabellene som nå er borte;
+        # hver tilkobling kjører DEALLOCATE ALL neste gang den brukes (_execute_prepared)
+        self._statement_generation += 1
 
-        self.connection.commit()
         print("All tables deleted.")
 
 
+class AsyncDB:
+    """
+    Async-variant av DB: hver metode kjøres i en tråd med sin egen lånte tilkobling,
+    slik at event loopen ikke blokkeres, f.eks. await mydb.aio.get_rows(Exam, {...}).
+    Kallene er autocommit; bruk DB.transaction() i en tråd for flere kall i én transaksjon.
+    """
+
+    def __init__(self, db: DB):
+        self.db = db
+
+    def __getattr__(self, name: str):
+        method = getattr(self.db, name)
+
+        async def run(*args, **kwargs):
+            return await asyncio.to_thread(method, *args, **kwargs)
+
+        return run
@@ -0,0 +1,198 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+def content_key(*parts) -> str:
+    """
+    SHA-256 over alle deler. bytes hashes direkte, alt annet som str.
+    Delene skilles med en NUL-byte slik at ("ab", "c") og ("a", "bc") gir ulik nøkkel.
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if part is None:
+            part = b""
+        elif not isinstance(part, bytes):
+            part = str(part).encode("utf-8")
+        h.update(part)
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+class DiskCache:
+    """
+    Enkel persistent nøkkel/verdi-cache i SQLite.
+
+    - ttl: sekunder en verdi er gyldig (None = for alltid)
+    - max_entries / max_bytes: eldste (sist brukt) verdier kastes når grensen overskrides.
+      Sjekkes bare hver evict_every skriving, så grensene kan overskrides litt innimellom
+    - accessed oppdateres samlet for touch_batch treff om gangen, ikke per get
+    - hits / misses: tellere for denne prosessen
+
+    Filen kan deles mellom tråder og prosesser (WAL + busy timeout).
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        *,
+        ttl: float | None = None,
+        max_entries: int | None = None,
+        max_bytes: int | None = None,
+        evict_every: int = 256,
+        touch_batch: int = 64,
+    ):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self.touch_batch = touch_batch
+
+        self.hits = 0
+        self.misses = 0
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._touched: dict[str, float] = {}  # key -> sist brukt, ikke skrevet ennå
+
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> bytes | None:
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT value, created FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+
+        now = time.time()
+        if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+            with conn:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            row = None
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[key] = now
+            flush = len(self._touched) >= self.touch_batch
+
+        if flush:
+            self.flush_accessed()
+        return row[0]
+
+    def flush_accessed(self) -> None:
+        # Skriver alle ventende accessed-tider i én transaksjon
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if not touched:
+            return
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "UPDATE cache SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in touched.items()]
+            )
+
+    def set(self, key: str, value: bytes) -> None:
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now)
+            )
+
+        # Eviction skanner hele tabellen, så den kjøres bare hver evict_every skriving
+        with self._lock:
+            self._writes += 1
+            due = self._writes % self.evict_every == 0
+        if due:
+            self.evict()
+
+    def delete(self, key: str) -> None:
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def get_text(self, key: str) -> str | None:
+        value = self.get(key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set_text(self, key: str, value: str) -> None:
+        self.set(key, value.encode("utf-8"))
+
+    def evict(self) -> int:
+        """
+        Fjerner utløpte verdier og de minst nylig brukte til grensene er overholdt.
+        Returnerer antall fjernede rader.
+        """
+        self.flush_accessed()
+        conn = self._connection()
+        removed = 0
+        with conn:
+            if self.ttl is not None:
+                removed += conn.execute(
+                    "DELETE FROM cache WHERE created < ?", (time.time() - self.ttl,)
+                ).rowcount
+
+            if self.max_entries is not None:
+                removed += conn.execute("""
+                    DELETE FROM cache WHERE key IN (
+                        SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,)).rowcount
+
+            if self.max_bytes is not None:
+                removed += conn.execute("""
+                    DELETE FROM cache WHERE key IN (
+                        SELECT key FROM (
+                            SELECT key, SUM(size) OVER (ORDER BY accessed DESC) AS total
+                            FROM cache
+                        ) WHERE total > ?
+                    )
+                """, (self.max_bytes,)).rowcount
+        return removed
+
+    def clear(self) -> None:
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM cache")
+
+    def stats(self) -> dict:
+        entries, size = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache"
+        ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
@@ -0,0 +1,92 @@
+import asyncio
+import inspect
+import time
+from typing import Callable
+
+
+class ExtractionStage:
+    """
+    Avhengighetsstyrt kjøring av ekstraksjonssteg.
+
+    Hvert steg er en funksjon som tar resultatene av stegene den avhenger av som
+    keyword-argumenter. Async-funksjoner (typisk prompt_llm_async) awaites direkte, vanlige
+    funksjoner (typisk DB-oppslag) kjøres i en tråd. Alle steg startes samtidig og venter
+    bare på sine egne avhengigheter, så total tid blir omtrent den lengste kjeden i stedet
+    for summen av alle kall.
+    """
+
+    def __init__(self):
+        self._steps: dict[str, tuple[Callable, tuple[str, ...], dict]] = {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._steps
+
+    def add(self, name: str, func: Callable, depends_on: tuple[str, ...] = (), inputs: dict | None = None) -> None:
+        """
+        inputs er faste keyword-argumenter for steget (f.eks. et eget tekstutdrag), som
+        kommer i tillegg til resultatene fra depends_on.
+        """
+        if name in self._steps:
+            raise ValueError(f"Step {name} is already defined.")
+        self._steps[name] = (func, tuple(depends_on), dict(inputs or {}))
+
+    def _check_dependencies(self, inputs: dict) -> None:
+        for name, (_, depends_on, _) in self._steps.items():
+            for dependency in depends_on:
+                if dependency not in self._steps and dependency not in inputs:
+                    raise ValueError(f"Step {name} depends on unknown step {dependency}.")
+
+        visiting, done = set(), set()
+
+        def visit(name):
+            if name in done or name in inputs:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle involving step {name}.")
+            visiting.add(name)
+            for dependency in self._steps[name][1]:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self._steps:
+            visit(name)
+
+    async def run(self, log_timing: bool = False, **inputs) -> dict:
+        """
+        Kjører alle steg og returnerer et dict med inputs og resultatet av hvert steg.
+        """
+        self._check_dependencies(inputs)
+
+        start_time = time.time()
+        tasks: dict[str, asyncio.Task] = {}
+
+        async def run_step(name):
+            func, depends_on, kwargs = self._steps[name]
+            kwargs = dict(kwargs)
+            for dependency in depends_on:
+                kwargs[dependency] = inputs[dependency] if dependency in inputs else await tasks[dependency]
+
+            if inspect.iscoroutinefunction(func):
+                result = await func(**kwargs)
+            else:
+                result = await asyncio.to_thread(func, **kwargs)
+
+            if log_timing:
+                print(f"Step {name} finished after {time.time() - start_time:.2f} seconds.")
+            return result
+
+        for name in self._steps:
+            tasks[name] = asyncio.create_task(run_step(name))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+
+        results = dict(inputs)
+        for name, task in tasks.items():
+            results[name] = task.result()
+        return results
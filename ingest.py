@@ -0,0 +1,212 @@
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import Executor, FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Literal
+
+LEDGER_PATH = Path("ingest_ledger.jsonl")
+
+
+def file_sha256(path: str | Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def find_pdfs(target: str) -> list[Path]:
+    """
+    Alle PDF-er i en mappe (rekursivt), eller filene som matcher et glob-mønster.
+    """
+    path = Path(target)
+    if path.is_dir():
+        paths = (p for p in path.rglob("*") if p.suffix.lower() == ".pdf")
+    else:
+        paths = (Path(p) for p in glob.glob(target, recursive=True))
+    return sorted(p for p in paths if p.is_file())
+
+
+class IngestLedger:
+    """
+    Append-only JSONL-logg over ferdig prosesserte filer, nøklet på SHA-256 av innholdet.
+    En ny kjøring hopper over alt som allerede står i loggen, også om filen har fått
+    nytt navn eller ligger flere steder.
+    """
+
+    def __init__(self, path: str | Path = LEDGER_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.completed: dict[str, dict] = {}
+
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # avbrutt skriving fra en tidligere kjøring
+                    self.completed[entry["sha256"]] = entry
+
+    def __contains__(self, sha256: str) -> bool:
+        return sha256 in self.completed
+
+    def record(self, entry: dict) -> None:
+        entry = {**entry, "finished": datetime.now().isoformat(timespec="seconds")}
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.completed[entry["sha256"]] = entry
+
+
+def ingest_file(path: str, sha256: str) -> dict:
+    """
+    Prosesserer én PDF gjennom Exam. Kjøres i en worker-prosess eller -tråd.
+    """
+    # Importeres her slik at hver worker-prosess setter opp sin egen DB-tilkobling
+    from exam_pipeline import Exam
+
+    start_time = time.time()
+    exam = Exam(path)
+    return {
+        "sha256": sha256,
+        "path": str(path),
+        "exam_id": getattr(exam, "id", None),
+        "seconds": round(time.time() - start_time, 2),
+    }
+
+
+def make_executor(workers: int, mode: Literal["process", "thread"]) -> Executor:
+    if mode == "process":
+        # spawn: ingen arvede DB-/HTTP-tilkoblinger fra foreldreprosessen
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return ThreadPoolExecutor(max_workers=workers)
+
+
+def ingest(
+    paths: Iterable[Path],
+    *,
+    workers: int = 4,
+    mode: Literal["process", "thread"] = "process",
+    ledger: IngestLedger | None = None,
+    max_in_flight: int | None = None,
+) -> dict:
+    """
+    Kjører ingest_file over alle filer med en begrenset worker-pool. Maks max_in_flight
+    filer er sendt til poolen om gangen, så store kataloger ikke fyller minnet med ventende
+    jobber. Returnerer en oppsummering.
+    """
+    ledger = ledger or IngestLedger()
+    max_in_flight = max_in_flight or workers * 2
+
+    summary = {"done": 0, "skipped": 0, "failed": 0, "failures": []}
+    seen: set[str] = set()
+    in_flight: dict[Future, Path] = {}
+
+    def collect(finished) -> None:
+        for future in finished:
+            path = in_flight.pop(future)
+            try:
+                entry = future.result()
+            except Exception as e:
+                summary["failed"] += 1
+                summary["failures"].append({"path": str(path), "error": repr(e)})
+                print(f"Failed to ingest {path}: {e!r}")
+                traceback.print_exception(e)
+                continue
+            ledger.record(entry)
+            summary["done"] += 1
+            print(f"Ingested {path} as exam {entry['exam_id']} in {entry['seconds']} seconds.")
+
+    with make_executor(workers, mode) as executor:
+        for path in paths:
+            sha256 = file_sha256(path)
+            if sha256 in ledger or sha256 in seen:
+                summary["skipped"] += 1
+                continue
+            seen.add(sha256)
+
+            while len(in_flight) >= max_in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(finished)
+
+            in_flight[executor.submit(ingest_file, str(path), sha256)] = path
+
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            collect(finished)
+
+    print(
+        f"Ingestion finished: {summary['done']} done, {summary['skipped']} skipped, "
+        f"{summary['failed']} failed."
+    )
+    return summary
+
+
+def add_ingest_arguments(parser) -> None:
+    parser.add_argument("target", help="Directory of PDFs or a glob pattern, e.g. 'exams/**/*.pdf'")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Number of worker processes/threads")
+    parser.add_argument("--mode", choices=["process", "thread"], default="process", help="Worker pool type")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="Max files queued in the pool at once")
+    parser.add_argument("--llm-concurrency", type=int, default=None, help="Max concurrent LLM calls per worker")
+    parser.add_argument("--ocr-concurrency", type=int, default=None, help="Max concurrent Vision requests per worker")
+    parser.add_argument("--ocr-rate", type=float, default=None, help="Max Vision images per second in total, split between worker processes")
+    parser.add_argument(
+        "--tesseract-workers", type=int, default=None,
+        help="Tesseract processes per worker (default: CPU count divided by --workers in process mode)"
+    )
+    parser.add_argument("--ledger", default=str(LEDGER_PATH), help="Ledger of completed file hashes")
+
+
+def run_ingest(args) -> dict:
+    if args.llm_concurrency:
+        # Leses av prompt_llm ved import, også i spawnede worker-prosesser
+        os.environ["LLM_MAX_CONCURRENCY"] = str(args.llm_concurrency)
+        import prompt_llm
+        prompt_llm.LLM_MAX_CONCURRENCY = args.llm_concurrency
+
+    if args.ocr_concurrency or args.ocr_rate:
+        # Miljøvariablene for spawnede workers; configure_ocr for denne prosessen (og
+        # trådmodus), der ocr allerede er importert via exam_pipeline
+        if args.ocr_concurrency:
+            os.environ["OCR_MAX_CONCURRENCY"] = str(args.ocr_concurrency)
+        if args.ocr_rate:
+            # --ocr-rate er for hele kjøringen: i trådmodus deler alle én TokenBucket, mens
+            # hver worker-prosess har sin egen og får sin andel
+            per_process = args.ocr_rate / args.workers if args.mode == "process" else args.ocr_rate
+            os.environ["OCR_RATE_LIMIT"] = str(per_process)
+        from ocr import configure_ocr
+        configure_ocr(max_concurrency=args.ocr_concurrency, rate_limit=args.ocr_rate)
+
+    # Hver worker-prosess får sin egen Tesseract-pool, så uten deling ville en full kjøring
+    # startet cpu_count² Tesseract-prosesser. I trådmodus deles én pool av alle trådene.
+    tesseract_workers = args.tesseract_workers
+    if tesseract_workers is None and args.mode == "process":
+        tesseract_workers = max(1, (os.cpu_count() or 1) // args.workers)
+    if tesseract_workers:
+        os.environ["TESSERACT_WORKERS"] = str(tesseract_workers)
+        import tesseract_ocr
+        tesseract_ocr.TESSERACT_WORKERS = tesseract_workers
+
+    paths = find_pdfs(args.target)
+    print(f"Found {len(paths)} PDF files in {args.target}.")
+    return ingest(
+        paths,
+        workers=args.workers,
+        mode=args.mode,
+        ledger=IngestLedger(args.ledger),
+        max_in_flight=args.max_in_flight,
+    )
@@ -0,0 +1,210 @@
+import re
+import zlib
+
+import numpy as np
+
+MIN_TEXT_BLOCK_AREA = 500  # pt², mindre tekstblokker er sidetall, punkter og støy
+COLUMN_GAP = 12.0  # minste tomrom (pt) mellom to spalter
+MARGIN_ZONE = 0.1  # andel av sidehøyden øverst og nederst der topp- og bunntekst står
+MARGIN_QUANTUM = 4.0  # pt, y-posisjonen til topp- og bunntekst rundes til dette
+REPEAT_MIN_PAGES = 3
+REPEAT_MIN_SHARE = 0.5  # andel av sidene en topp- eller bunntekst må gå igjen på
+BOILERPLATE_QUANTUM = 8.0  # pt, bbox rundes til dette før fingeravtrykket
+
+
+def block_bboxes(raw_blocks: list[dict]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    bbox-ene (n x 4) og typene til blokkene fra get_text("dict") som NumPy-arrays.
+    """
+    bboxes = np.array([block["bbox"] for block in raw_blocks], dtype=np.float64).reshape(-1, 4)
+    types = np.array([block["type"] for block in raw_blocks], dtype=np.int64)
+    return bboxes, types
+
+
+def keep_mask(bboxes: np.ndarray, types: np.ndarray, page_rect: tuple) -> np.ndarray:
+    """
+    Blokkene som beholdes: ikke små tekstblokker (under MIN_TEXT_BLOCK_AREA), ikke tomme
+    og ikke helt utenfor siden.
+    """
+    x0, y0, x1, y1 = bboxes.T
+    width, height = np.abs(x1 - x0), np.abs(y1 - y0)
+    small_text = (types == 0) & (width * height < MIN_TEXT_BLOCK_AREA)
+    empty = (width == 0) & (height == 0)
+    outside = (x1 <= page_rect[0]) | (y1 <= page_rect[1]) | (x0 >= page_rect[2]) | (y0 >= page_rect[3])
+    return ~(small_text | empty | outside)
+
+
+def gap_intervals(lo: np.ndarray, hi: np.ndarray, min_gap: float) -> np.ndarray:
+    """
+    Tomrommene (start, slutt) på minst min_gap som ingen av intervallene [lo, hi] dekker.
+    """
+    if len(lo) < 2:
+        return np.empty((0, 2))
+    order = np.argsort(lo, kind="stable")
+    reach = np.maximum.accumulate(hi[order])[:-1]
+    starts = lo[order][1:]
+    found = starts - reach >= min_gap
+    return np.column_stack([reach[found], starts[found]])
+
+
+def _common_gaps(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # Snittet av to sett med tomrom, bare de som fortsatt er minst COLUMN_GAP brede
+    starts = np.maximum(a[:, None, 0], b[None, :, 0]).ravel()
+    ends = np.minimum(a[:, None, 1], b[None, :, 1]).ravel()
+    keep = ends - starts >= COLUMN_GAP
+    return np.column_stack([starts[keep], ends[keep]])
+
+
+def _xy_cut(bboxes: np.ndarray, rows: np.ndarray) -> list[np.ndarray]:
+    if len(rows) < 2:
+        return [rows]
+    x0, y0, x1, y1 = bboxes[rows].T
+
+    # Spalter: et loddrett tomrom ingen blokk krysser deler siden venstre mot høyre
+    columns = gap_intervals(x0, x1, COLUMN_GAP)
+    if len(columns):
+        group = np.searchsorted(columns[:, 0], x0)
+        return [part for g in range(len(columns) + 1) for part in _xy_cut(bboxes, rows[group == g])]
+
+    # Ellers bånd ovenfra og ned. Bånd etter hverandre med samme spaltetomrom slås sammen,
+    # slik at to spalter med avsnitt på samme høyde leses spalte for spalte, ikke linje for linje
+    bands = gap_intervals(y0, y1, 0.5)
+    if not len(bands):
+        return [rows[np.lexsort((x0, y0))]]
+    band = np.searchsorted(bands[:, 0], y0)
+
+    groups, current, gaps = [], None, np.empty((0, 2))
+    for b in range(len(bands) + 1):
+        members = rows[band == b]
+        member_gaps = gap_intervals(bboxes[members, 0], bboxes[members, 2], COLUMN_GAP)
+        shared = _common_gaps(gaps, member_gaps) if current is not None else np.empty((0, 2))
+        if len(shared):
+            current = np.concatenate([current, members])
+            gaps = shared
+        else:
+            if current is not None:
+                groups.append(current)
+            current, gaps = members, member_gaps
+    groups.append(current)
+
+    if len(groups) == 1:
+        return [rows[np.lexsort((x0, y0))]]
+    return [part for members in groups for part in _xy_cut(bboxes, members)]
+
+
+def reading_order(bboxes: np.ndarray) -> np.ndarray:
+    """
+    Rekkefølgen (indekser) blokkene leses i, med rekursiv XY-cut: spalter venstre mot
+    høyre, bånd ovenfra og ned.
+    """
+    if not len(bboxes):
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate(_xy_cut(bboxes, np.arange(len(bboxes))))
+
+
+def page_block_order(raw_blocks: list[dict], page_rect: tuple) -> np.ndarray:
+    """
+    Indeksene til blokkene som skal beholdes på siden, i lesefølge.
+    """
+    bboxes, types = block_bboxes(raw_blocks)
+    kept = np.flatnonzero(keep_mask(bboxes, types, page_rect))
+    return kept[reading_order(bboxes[kept])]
+
+
+def running_margin_blocks(pages: list[tuple[np.ndarray, float]]) -> list[np.ndarray]:
+    """
+    Topp- og bunntekst som går igjen: blokker i øvre eller nedre MARGIN_ZONE med samme
+    (avrundede) høyde på siden på minst REPEAT_MIN_SHARE av sidene. Teksten sammenlignes
+    ikke, så "Side 3 av 10" regnes som samme bunntekst på hver side.
+
+    pages er (bboxes, sidehøyde) per side. Returnerer en bool-maske per side.
+    """
+    if not pages:
+        return []
+    counts = [len(bboxes) for bboxes, _ in pages]
+    bboxes = np.concatenate([bboxes.reshape(-1, 4) for bboxes, _ in pages])
+    heights = np.repeat([height for _, height in pages], counts)
+    page_index = np.repeat(np.arange(len(pages)), counts)
+
+    top = bboxes[:, 3] <= heights * MARGIN_ZONE
+    bottom = bboxes[:, 1] >= heights * (1 - MARGIN_ZONE)
+    in_margin = top | bottom
+
+    repeated = np.zeros(len(bboxes), dtype=bool)
+    if in_margin.any():
+        keys = np.column_stack([
+            bottom,
+            np.round(bboxes[:, 1] / MARGIN_QUANTUM),
+            np.round(bboxes[:, 3] / MARGIN_QUANTUM),
+        ]).astype(np.int64)[in_margin]
+        key_ids, key_of_block = np.unique(keys, axis=0, return_inverse=True)
+
+        # Antall forskjellige sider hver posisjon finnes på
+        pairs = np.unique(np.column_stack([key_of_block.ravel(), page_index[in_margin]]), axis=0)
+        pages_per_key = np.bincount(pairs[:, 0], minlength=len(key_ids))
+
+        threshold = max(REPEAT_MIN_PAGES, REPEAT_MIN_SHARE * len(pages))
+        repeated[in_margin] = pages_per_key[key_of_block.ravel()] >= threshold
+    return np.split(repeated, np.cumsum(counts)[:-1])
+
+
+def normalize_block_text(text: str) -> str:
+    # Tall byttes ut, så "Side 3 av 10" og "Side 4 av 10" gir samme tekst
+    return re.sub(r"\s+", " ", re.sub(r"\d+", "#", text.casefold())).strip()
+
+
+def block_fingerprints(texts: list[str], bboxes: np.ndarray) -> np.ndarray:
+    """
+    Ett 64-bits fingeravtrykk per blokk av normalisert tekst og avrundet bbox.
+    """
+    text_hashes = np.fromiter(
+        (zlib.crc32(normalize_block_text(text).encode("utf-8")) for text in texts),
+        dtype=np.uint64, count=len(texts)
+    )
+    boxes = np.round(bboxes.reshape(-1, 4) / BOILERPLATE_QUANTUM).astype(np.int64)
+    box_hashes = np.zeros(len(boxes), dtype=np.uint64)
+    for column in range(4):
+        box_hashes = box_hashes * np.uint64(1_000_003) + boxes[:, column].astype(np.uint64)
+    return (text_hashes << np.uint64(32)) ^ box_hashes
+
+
+def boilerplate_blocks(pages: list[tuple[list[str], np.ndarray]]) -> list[np.ndarray]:
+    """
+    Blokker som går igjen med samme tekst (tall sett bort fra) på samme sted på minst
+    REPEAT_MIN_SHARE av sidene: instituttnavn, kontaktinfo, "Side X av Y" osv.
+    Blokker uten tekst regnes ikke med. Alle forekomstene markeres, også den første
+    (se first_occurrences).
+
+    pages er (tekster, bboxes) per side. Returnerer en bool-maske per side.
+    """
+    if not pages:
+        return []
+    counts = [len(texts) for texts, _ in pages]
+    texts = [text for page_texts, _ in pages for text in page_texts]
+    fingerprints = block_fingerprints(texts, np.concatenate([bboxes.reshape(-1, 4) for _, bboxes in pages]))
+    page_index = np.repeat(np.arange(len(pages)), counts)
+    has_text = np.array([bool(text.strip()) for text in texts], dtype=bool)
+
+    # Antall forskjellige sider hvert fingeravtrykk finnes på
+    unique, block_key = np.unique(fingerprints, return_inverse=True)
+    pairs = np.unique(np.column_stack([block_key.ravel(), page_index]), axis=0)
+    pages_per_key = np.bincount(pairs[:, 0], minlength=len(unique))
+
+    threshold = max(REPEAT_MIN_PAGES, REPEAT_MIN_SHARE * len(pages))
+    repeated = (pages_per_key[block_key.ravel()] >= threshold) & has_text
+    return np.split(repeated, np.cumsum(counts)[:-1])
+
+
+def first_occurrences(texts: list[str], mask: np.ndarray) -> np.ndarray:
+    """
+    Den første av de markerte blokkene (mask) for hver normaliserte tekst, i rekkefølgen
+    blokkene står. texts og mask gjelder alle sidene etter hverandre.
+    """
+    first = np.zeros(len(texts), dtype=bool)
+    seen = set()
+    for i in np.flatnonzero(mask):
+        key = normalize_block_text(texts[i])
+        if key not in seen:
+            seen.add(key)
+            first[i] = True
+    return first
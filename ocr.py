@@ -1,29 +1,356 @@
+from __future__ import annotations
 import os
 import asyncio
-from google.cloud import vision
-import fitz 
+import random
+import threading
+import time
+import json
+import hashlib
+from abc import ABC, abstractmethod
+from pathlib import Path
+from collections import OrderedDict
+from typing import TYPE_CHECKING
 
-json_path = os.getenv("OCRACLE_JSON_PATH")
-os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = json_path
-if not json_path:
-    raise ValueError("OCRACLE_JSON_PATH environment variable not set.")
-client = vision.ImageAnnotatorClient()
+from disk_cache import DiskCache, content_key
 
-async def run_in_threads(func, items):
-    tasks = [asyncio.to_thread(func, item) for item in items]
-    return await asyncio.gather(*tasks)
+if TYPE_CHECKING:
+    import fitz
 
-def page_to_image_bytes(page) -> bytes:
-    mat = fitz.Matrix(2, 2)
-    pix = page.get_pixmap(matrix=mat, alpha=False)
-    return pix.tobytes("png")
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", 8))  # Vision tillater maks 16 bilder per kall
+OCR_MAX_CONCURRENCY = int(os.getenv("OCR_MAX_CONCURRENCY", 4))
+OCR_RATE_LIMIT = float(os.getenv("OCR_RATE_LIMIT", 10))  # bilder per sekund
+OCR_MAX_RETRIES = int(os.getenv("OCR_MAX_RETRIES", 5))
+
+
+class TokenBucket:
+    """
+    Trådsikker token bucket. acquire(n) blokkerer til n tokens er tilgjengelige.
+    Fylles med rate tokens per sekund, opp til capacity.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, n: float = 1) -> None:
+        n = min(n, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= n:
+                    self._tokens -= n
+                    return
+                wait = (n - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+vision_rate_limit = TokenBucket(OCR_RATE_LIMIT)
+
+
+def configure_ocr(max_concurrency: int | None = None, rate_limit: float | None = None) -> None:
+    """
+    Endrer samtidighet og rate limit etter import (f.eks. fra ingest-flaggene), siden
+    miljøvariablene bare leses når modulen importeres.
+    """
+    global OCR_MAX_CONCURRENCY, OCR_RATE_LIMIT, vision_rate_limit
+    if max_concurrency:
+        OCR_MAX_CONCURRENCY = max_concurrency
+    if rate_limit:
+        OCR_RATE_LIMIT = rate_limit
+        vision_rate_limit = TokenBucket(OCR_RATE_LIMIT)
+
+
+def with_retry(func, *args, max_retries: int = OCR_MAX_RETRIES, base_delay: float = 1.0, max_delay: float = 30.0):
+    """
+    Kaller func(*args) og prøver på nytt med eksponentiell backoff og jitter ved feil.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return func(*args)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            print(f"{func.__name__} failed ({e!r}), retrying in {delay:.1f} seconds. ")
+            time.sleep(delay)
+
+
+async def run_in_threads(func, items, max_concurrency: int | None = None):
+    if max_concurrency is None:
+        tasks = [asyncio.to_thread(func, item) for item in items]
+        return await asyncio.gather(*tasks)
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(item):
+        async with semaphore:
+            return await asyncio.to_thread(func, item)
+
+    return await asyncio.gather(*(run(item) for item in items))
+
+RENDER_DPI = int(os.getenv("RENDER_DPI", 144))  # 144 dpi = 2x zoom
+RENDER_GRAYSCALE = os.getenv("RENDER_GRAYSCALE") == "1"
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", 8))  # antall pixmaps
+
+
+class PixmapCache:
+    """
+    Begrenset LRU over rendrede sider, slik at en side som trengs flere ganger (OCR,
+    utklipp, visning) bare rasteriseres én gang uten at alle sider holdes i minnet.
+    """
+
+    def __init__(self, max_size: int = RENDER_CACHE_SIZE):
+        self.max_size = max_size
+        self._pixmaps: OrderedDict[tuple, fitz.Pixmap] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> fitz.Pixmap | None:
+        with self._lock:
+            pix = self._pixmaps.get(key)
+            if pix is not None:
+                self._pixmaps.move_to_end(key)
+            return pix
+
+    def put(self, key: tuple, pix: fitz.Pixmap) -> None:
+        with self._lock:
+            self._pixmaps[key] = pix
+            self._pixmaps.move_to_end(key)
+            while len(self._pixmaps) > self.max_size:
+                self._pixmaps.popitem(last=False)
+
+    def discard_document(self, doc) -> None:
+        with self._lock:
+            for key in [key for key in self._pixmaps if key[0] == id(doc)]:
+                del self._pixmaps[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pixmaps.clear()
+
+
+pixmap_cache = PixmapCache()
+
+
+def render_page(page, dpi: int | None = None, grayscale: bool | None = None) -> fitz.Pixmap:
+    """
+    Rasteriserer en side ved behov. dpi og grayscale faller tilbake på RENDER_DPI og
+    RENDER_GRAYSCALE.
+    """
+    dpi = dpi or RENDER_DPI
+    grayscale = RENDER_GRAYSCALE if grayscale is None else grayscale
+
+    key = (id(page.parent), page.parent.name, page.number, dpi, grayscale)
+    pix = pixmap_cache.get(key)
+    if pix is None:
+        import fitz
+        pix = page.get_pixmap(
+            dpi=dpi,
+            colorspace=fitz.csGRAY if grayscale else fitz.csRGB,
+            alpha=False
+        )
+        pixmap_cache.put(key, pix)
+    return pix
+
+def page_to_image_bytes(page, dpi: int | None = None, grayscale: bool | None = None) -> bytes:
+    return render_page(page, dpi=dpi, grayscale=grayscale).tobytes("png")
+
+_vision_client = None
+_vision_lock = threading.Lock()
+
+def vision_available() -> bool:
+    return bool(os.getenv("OCRACLE_JSON_PATH"))
+
+def get_vision_client():
+    """
+    Vision-klienten opprettes først når den trengs, så OCR med Tesseract (og tester) kan
+    kjøre uten Google-nøkkel.
+    """
+    global _vision_client
+    with _vision_lock:
+        if _vision_client is None:
+            json_path = os.getenv("OCRACLE_JSON_PATH")
+            if not json_path:
+                raise ValueError("OCRACLE_JSON_PATH environment variable not set.")
+            os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = json_path
+            from google.cloud import vision
+            _vision_client = vision.ImageAnnotatorClient()
+        return _vision_client
 
 def ocr_image(image: bytes) -> str:
     try:
+        from google.cloud import vision
         image = vision.Image(content=image)
-        response = client.text_detection(image=image)
+        response = get_vision_client().text_detection(image=image)
         return response.text_annotations
     except Exception as e:
         print(f"Error during OCR processing: {e}")
         return ""
-    
\ No newline at end of file
+
+def _annotate_batch(images: list[bytes]):
+    from google.cloud import vision
+    client = get_vision_client()
+    vision_rate_limit.acquire(len(images))
+    return client.batch_annotate_images(requests=[
+        vision.AnnotateImageRequest(
+            image=vision.Image(content=image),
+            features=[vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)]
+        )
+        for image in images
+    ])
+
+def annotations_to_result(text_annotations) -> dict:
+    """
+    Strukturert OCR-resultat fra Vision: hele teksten og hvert ord med bbox (x0, y0, x1, y1)
+    i pikselkoordinater på det rendrede bildet.
+    """
+    if not text_annotations:
+        return {"text": "", "words": []}
+
+    words = []
+    for annotation in text_annotations[1:]:
+        xs = [vertex.x for vertex in annotation.bounding_poly.vertices]
+        ys = [vertex.y for vertex in annotation.bounding_poly.vertices]
+        words.append({
+            "text": annotation.description,
+            "bbox": [min(xs), min(ys), max(xs), max(ys)],
+        })
+    return {"text": text_annotations[0].description, "words": words}
+
+def ocr_batch(images: list[bytes]) -> list[dict]:
+    """
+    OCR av flere bilder i ett batch_annotate_images-kall, med rate limiting og retry.
+    Bilder som feilet får et tomt resultat med "error" satt.
+    """
+    try:
+        response = with_retry(_annotate_batch, images)
+    except Exception as e:
+        print(f"Error during OCR processing: {e}")
+        return [{"text": "", "words": [], "error": str(e)} for _ in images]
+
+    results = []
+    for image_response in response.responses:
+        if image_response.error.message:
+            print(f"Error during OCR processing: {image_response.error.message}")
+            results.append({"text": "", "words": [], "error": image_response.error.message})
+        else:
+            results.append(annotations_to_result(image_response.text_annotations))
+    return results
+
+OCR_CACHE_PATH = Path(os.getenv("OCR_CACHE_PATH", "ocr_cache.sqlite"))
+
+_ocr_cache: DiskCache | None = None
+
+def get_ocr_cache() -> DiskCache:
+    global _ocr_cache
+    if _ocr_cache is None:
+        _ocr_cache = DiskCache(OCR_CACHE_PATH)
+    return _ocr_cache
+
+def ocr_cache_key(image: bytes, settings: str, backend: str = "vision") -> str:
+    return content_key(backend, "TEXT_DETECTION", settings, hashlib.sha256(image).digest())
+
+def render_settings(dpi: int | None = None, grayscale: bool | None = None) -> str:
+    dpi = dpi or RENDER_DPI
+    grayscale = RENDER_GRAYSCALE if grayscale is None else grayscale
+    return f"dpi={dpi},grayscale={int(grayscale)}"
+
+
+class OCRBackend(ABC):
+    """
+    Felles grensesnitt for OCR av rendrede sider. ocr_pages tar PNG-bytes og returnerer
+    ett resultat per bilde, {"text": ..., "words": [{"text": ..., "bbox": [...]}, ...]},
+    i samme rekkefølge. Resultatene caches på disk per backend, nøklet på hash av bildet
+    og render-innstillingene.
+
+    Underklasser setter name og implementerer _ocr. Feilede bilder får "error" satt og
+    caches ikke.
+    """
+
+    name: str
+
+    @abstractmethod
+    def _ocr(self, images: list[bytes]) -> list[dict]:
+        """
+        OCR av bildene uten cache, ett resultat per bilde i samme rekkefølge.
+        """
+
+    def ocr_pages(self, images: list[bytes], settings: str | None = None, use_cache: bool = True) -> list[dict]:
+        settings = settings or render_settings()
+        cache = get_ocr_cache()
+
+        keys = [ocr_cache_key(image, settings, self.name) for image in images]
+        results: list[dict | None] = [None] * len(images)
+        if use_cache:
+            for i, key in enumerate(keys):
+                cached = cache.get_text(key)
+                if cached is not None:
+                    results[i] = json.loads(cached)
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            for i, result in zip(missing, self._ocr([images[i] for i in missing])):
+                results[i] = result
+                if use_cache and "error" not in result:
+                    cache.set_text(keys[i], json.dumps(result, ensure_ascii=False))
+
+        return results
+
+
+class VisionOCR(OCRBackend):
+    """
+    Google Vision TEXT_DETECTION. Bildene deles i batcher som sendes samtidig (maks
+    max_concurrency kall i gang).
+    """
+
+    name = "vision"
+
+    def __init__(self, batch_size: int | None = None, max_concurrency: int | None = None):
+        # None: modulverdiene slås opp ved hvert kall, så configure_ocr også gjelder her
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+
+    def _ocr(self, images: list[bytes]) -> list[dict]:
+        batch_size = self.batch_size or OCR_BATCH_SIZE
+        batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+        max_concurrency = self.max_concurrency or OCR_MAX_CONCURRENCY
+        batch_results = asyncio.run(run_in_threads(ocr_batch, batches, max_concurrency=max_concurrency))
+        return [result for batch_result in batch_results for result in batch_result]
+
+
+async def ocr_images_async(
+    images: list[bytes],
+    batch_size: int | None = None,
+    max_concurrency: int | None = None,
+    settings: str | None = None,
+    use_cache: bool = True,
+) -> list[dict]:
+    return await asyncio.to_thread(
+        ocr_images,
+        images,
+        batch_size=batch_size,
+        max_concurrency=max_concurrency,
+        settings=settings,
+        use_cache=use_cache
+    )
+
+def ocr_images(
+    images: list[bytes],
+    batch_size: int | None = None,
+    max_concurrency: int | None = None,
+    settings: str | None = None,
+    use_cache: bool = True,
+) -> list[dict]:
+    """
+    OCR av mange sider med Vision. Resultatene returneres i samme rekkefølge som bildene.
+
+    Resultater lagres i en lokal cache nøklet på hash av bildet og render-innstillingene
+    (settings), delt mellom kjøringer og workers, så samme side aldri sendes til Vision
+    to ganger.
+    """
+    backend = VisionOCR(batch_size=batch_size, max_concurrency=max_concurrency)
+    return backend.ocr_pages(images, settings=settings, use_cache=use_cache)
@@ -0,0 +1,89 @@
+import os
+from typing import Literal
+
+from ocr import OCRBackend, VisionOCR, render_settings, vision_available
+from tesseract_ocr import TesseractOCR
+
+OCR_BACKEND: Literal["auto", "vision", "tesseract"] = os.getenv("OCR_BACKEND", "auto")
+TESSERACT_MIN_CONFIDENCE = float(os.getenv("TESSERACT_MIN_CONFIDENCE", 75))
+TESSERACT_MIN_WORDS = int(os.getenv("TESSERACT_MIN_WORDS", 10))
+
+
+class OCRRouter:
+    """
+    Velger OCR per side:
+
+    - "native": siden har et brukbart tekstlag fra PDF-en, ingen OCR.
+    - "tesseract": lokal OCR i prosesspoolen, godt nok for enkle skann.
+    - "vision": sider der Tesseract har lav konfidens eller finner nesten ingenting
+      (håndskrift, formler, dårlige skann) sendes videre til Google Vision.
+
+    mode="tesseract" (eller "auto" uten OCRACLE_JSON_PATH) kjører helt offline,
+    mode="vision" sender alle sider uten tekstlag rett til Vision.
+
+    Sidene må ha needs_ocr (se text_quality), native_text og get_image_bytes(); bilder
+    rendres bare for sider som faktisk skal OCR-es.
+    """
+
+    def __init__(
+        self,
+        mode: Literal["auto", "vision", "tesseract"] | None = None,
+        fast: OCRBackend | None = None,
+        accurate: OCRBackend | None = None,
+    ):
+        self.mode = mode or OCR_BACKEND
+        if self.mode == "auto" and not vision_available():
+            self.mode = "tesseract"
+        self.fast = fast or TesseractOCR()
+        self.accurate = accurate or VisionOCR()
+
+    def is_hard(self, result: dict) -> bool:
+        return (
+            "error" in result
+            or result.get("confidence", 0.0) < TESSERACT_MIN_CONFIDENCE
+            or len(result["words"]) < TESSERACT_MIN_WORDS
+        )
+
+    def ocr_pages(self, pages: list, settings: str | None = None) -> list[dict]:
+        """
+        Returnerer ett resultat per side, med "method" satt til backenden som ble brukt.
+        """
+        settings = settings or render_settings()
+        results: list[dict | None] = [None] * len(pages)
+
+        to_ocr = []
+        for i, page in enumerate(pages):
+            if page.needs_ocr:
+                to_ocr.append(i)
+            else:
+                results[i] = {"text": page.native_text, "words": [], "method": "native"}
+
+        if not to_ocr:
+            return results
+
+        images = {i: pages[i].get_image_bytes() for i in to_ocr}
+
+        if self.mode == "vision":
+            escalate = to_ocr
+        else:
+            for i, result in zip(to_ocr, self.fast.ocr_pages([images[i] for i in to_ocr], settings=settings)):
+                results[i] = {**result, "method": self.fast.name}
+            escalate = [i for i in to_ocr if self.mode == "auto" and self.is_hard(results[i])]
+
+        if escalate:
+            accurate_results = self.accurate.ocr_pages([images[i] for i in escalate], settings=settings)
+            for i, result in zip(escalate, accurate_results):
+                # Beholder Tesseract-resultatet hvis Vision feilet
+                if "error" not in result or results[i] is None:
+                    results[i] = {**result, "method": self.accurate.name}
+
+        return results
+
+
+_router: OCRRouter | None = None
+
+def get_ocr_router() -> OCRRouter:
+    global _router
+    if _router is None:
+        _router = OCRRouter()
+    return _router
@@ -1,14 +1,20 @@
+from __future__ import annotations
 import os
+import asyncio
+import weakref
 import time
 import base64
-import tkinter as tk
-from tkinter import filedialog
-from typing import Literal
+import json
+from typing import Literal, TYPE_CHECKING
 import threading
 from datetime import datetime
 from pathlib import Path
 import time
-from openai import OpenAI
+
+if TYPE_CHECKING:
+    from openai import OpenAI, AsyncOpenAI
+
+from disk_cache import DiskCache, content_key
 
 class LLMProvider:
     def __init__(self, *, name: str, base_url: str, model: str, cost: dict[str, float]):
@@ -18,14 +24,52 @@ class LLMProvider:
         self.model = model
         self.cost = cost  # USD per 1m tokens
 
+        # Klientene (og openai-importen) opprettes først ved første kall, så import av
+        # modulen verken er treg eller krever at alle API-nøkler er satt
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._async_limits = weakref.WeakKeyDictionary()
+
+    @property
+    def api_key(self) -> str:
         api_key = os.getenv(self.env_var)
         if not api_key:
             raise ValueError(f"{self.env_var} not found in enviroment variables.")
-        
-        self.client = OpenAI(
-            api_key=api_key,
-            base_url=base_url
-        )
+        return api_key
+
+    @property
+    def client(self) -> OpenAI:
+        with self._client_lock:
+            if self._client is None:
+                from openai import OpenAI
+                self._client = OpenAI(
+                    api_key=self.api_key,
+                    base_url=self.base_url
+                )
+            return self._client
+
+    def get_async_client(self) -> AsyncOpenAI:
+        # Async-klienten er bundet til event loopen den brukes i, så vi holder én per loop
+        loop = asyncio.get_running_loop()
+        async_client = self._async_clients.get(loop)
+        if async_client is None:
+            from openai import AsyncOpenAI
+            async_client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url
+            )
+            self._async_clients[loop] = async_client
+        return async_client
+
+    def get_async_limit(self) -> asyncio.Semaphore:
+        # Maks antall samtidige kall per event loop (LLM_MAX_CONCURRENCY)
+        loop = asyncio.get_running_loop()
+        limit = self._async_limits.get(loop)
+        if limit is None:
+            limit = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+            self._async_limits[loop] = limit
+        return limit
 
     def estimate_cost(self, n_tokens, token_type: Literal["input", "output"]):
         return (self.cost[token_type] / 1_000_000) * n_tokens
@@ -45,108 +89,263 @@ LLM_PROVIDERS = {
     )
 }
 
+LLM_CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 30 * 24 * 3600))  # sekunder
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 200_000))
+LLM_CACHE_BYPASS = os.getenv("LLM_CACHE_BYPASS") == "1"
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+
+# Tilfeldige prompt-eksempler gir en ny cache-nøkkel for hvert kall. Med denne satt
+# trekkes eksemplene deterministisk, slik at samme input gir samme prompt.
+DETERMINISTIC_EXAMPLES = os.getenv("LLM_DETERMINISTIC_EXAMPLES", "1") == "1"
+
+_llm_cache: DiskCache | None = None
+
+def get_llm_cache() -> DiskCache:
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = DiskCache(
+            LLM_CACHE_PATH,
+            ttl=LLM_CACHE_TTL,
+            max_entries=LLM_CACHE_MAX_ENTRIES
+        )
+    return _llm_cache
+
+def llm_cache_key(provider: LLMProvider, system_prompt: str, user_prompt: str, image_bytes: bytes | None, max_tokens: int) -> str:
+    return content_key(
+        provider.name,
+        provider.model,
+        max_tokens,
+        system_prompt,
+        user_prompt,
+        image_bytes
+    )
+
+class PromptRequest:
+    """
+    Ferdig bygget forespørsel: endelig system prompt, valgt provider og cache-nøkkel.
+    Deles av prompt_llm og prompt_llm_async.
+    """
+    def __init__(
+            self,
+            system_prompt: str,
+            user_prompt: str,
+            *,
+            response_type: Literal["text", "number", "text_list", "number_list", "json"],
+            image_bytes: bytes | None,
+            alternatives: list | None,
+            examples: list | None,
+            use_prompt_config: bool,
+            max_len: int,
+            use_cache: bool,
+            ):
+        if response_type not in ("text", "number", "text_list", "number_list", "json"):
+            raise ValueError(f"Invalid response_type: {response_type}")
+
+        self.start_time = time.time()
+
+        if use_prompt_config:
+            system_prompt += (
+                "DO AS YOU ARE TOLD AND RESPOND ONLY WITH WHAT IS ASKED FROM YOU. "
+                "DO NOT EXPLAIN OR SAY WHAT YOU ARE DOING (e.g. here is the..., below is..., sure here is..., etc.). "
+                "DO NOT WRITE ANY SYMBOLS LIKE \\n OR CHANGE LETTER FORMATTING WITH ** AND SIMILAR. "
+                "YOU ARE USED IN A TEXT PROCESSING PYTHON PROGRAM SO THE TEXT SHOULD BE PLAIN. "
+            )
+
+        if response_type == "number":
+            system_prompt += "RESPOND WITH A SINGLE NUMBER. NO QUOTATION MARKS. NO COMMAS. NO LISTS. "
+        elif response_type == "number_list":
+            system_prompt += "RESPOND WITH A LIST OF NUMBERS SEPARATED BY A COMMA. NOTHING ELSE. "
+        elif response_type == "json":
+            system_prompt += "RESPOND WITH A SINGLE JSON OBJECT. NOTHING ELSE. "
+
+        if alternatives:
+            enum_arr = []
+            for i, item in enumerate(alternatives):
+                enum_arr.append(f"{i}: {item}")
+            system_prompt += (
+                "HERE IS THE LIST OF NUMBERS YOU CAN CHOSE FROM AND THEIR VALUES: "
+                ", ".join(enum_arr)
+            )
+
+        if examples:
+            examples = ', '.join(map(str, examples))
+            system_prompt += (
+                f"HERE ARE SOME EXAMPLES: {examples}"
+            )
+
+        if image_bytes is None:
+            self.provider = LLM_PROVIDERS["groq"]
+            self.user_content = user_prompt
+        else:
+            self.provider = LLM_PROVIDERS["openai"]
+            data_url = f"data:image/png;base64,{base64.b64encode(image_bytes).decode('ascii')}"
+            self.user_content = [
+                        { "type": "text", "text": user_prompt },
+                        { "type": "image_url", "image_url": { "url": data_url}}
+                    ]
+
+        self.system_prompt = system_prompt
+        self.user_prompt = user_prompt
+        self.image_bytes = image_bytes
+        self.response_type = response_type
+        self.alternatives = alternatives
+        self.max_tokens = max_len // 4 if max_len // 4 > 5 else 5
+
+        self.use_cache = use_cache and not LLM_CACHE_BYPASS
+        self.cache_key = llm_cache_key(self.provider, system_prompt, user_prompt, image_bytes, self.max_tokens)
+
+    def completion_kwargs(self) -> dict:
+        kwargs = dict(
+            model=self.provider.model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": self.system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": self.user_content
+                }   
+            ],
+            max_tokens=self.max_tokens,
+            stream=False
+        )
+        if self.response_type == "json":
+            # JSON mode: modellen kan bare svare med et gyldig JSON-objekt
+            kwargs["response_format"] = {"type": "json_object"}
+        return kwargs
+
+    def cached_reply(self, log_prompt: bool) -> str | None:
+        if not self.use_cache:
+            return None
+        llm_reply = get_llm_cache().get_text(self.cache_key)
+        if llm_reply is not None and log_prompt:
+            print(f"Response served from cache ({get_llm_cache().hits} hits, {get_llm_cache().misses} misses).")
+        return llm_reply
+
+    def read_response(self, response, log_prompt: bool) -> str:
+        if not response.choices:
+            raise ValueError("No response from LLM.")
+        
+        llm_reply = response.choices[0].message.content.strip()
+
+        input_cost = self.provider.estimate_cost(n_tokens=((len(self.system_prompt) + len(self.user_prompt))//4), token_type="input")
+        if self.image_bytes is not None:
+            input_cost += self.provider.estimate_cost(n_tokens=int(len(base64.b64encode(self.image_bytes)) // 1000), token_type="input")
+        output_cost = self.provider.estimate_cost(n_tokens=(len(llm_reply)//4), token_type="output")
+
+        elapsed = time.time() - self.start_time 
+
+        if log_prompt:
+            print(f"Response took {int(elapsed)} seconds, and cost around {input_cost + output_cost:.6f} USD.")
+            log_prompt_to_file(self.system_prompt, self.user_content)
+
+        return llm_reply
+
+    def parse_and_cache(self, llm_reply: str, cached: bool):
+        """
+        Tolker svaret og lagrer det i cachen først når det lot seg tolke. Et svar som ikke
+        kan tolkes fjernes fra cachen, så et nytt forsøk spør modellen på nytt.
+        """
+        try:
+            reply = self.parse_reply(llm_reply)
+        except Exception:
+            if cached:
+                get_llm_cache().delete(self.cache_key)
+            raise
+        if self.use_cache and not cached:
+            get_llm_cache().set_text(self.cache_key, llm_reply)
+        return reply
+
+    def parse_reply(self, llm_reply: str):
+        if self.alternatives:
+            return self.alternatives[int(llm_reply.strip())]
+        if self.response_type == "json":
+            reply = json.loads(llm_reply)
+            if not isinstance(reply, dict):
+                raise ValueError(f"Expected a JSON object, got: {llm_reply[:100]}")
+            return reply
+        if self.response_type == "number":
+            return_type = float if "." in llm_reply else int
+            return return_type(llm_reply.strip())
+        elif self.response_type in ("number_list", "text_list"):
+            return_type = int if self.response_type == "number_list" else str
+            return [return_type(num.strip().upper()) for num in llm_reply.split(",")]
+        else:
+            return llm_reply
+
 def prompt_llm(
         system_prompt: str,
         user_prompt: str,
         *,
-        response_type: Literal["text", "number", "text_list", "number_list"] = "text",
+        response_type: Literal["text", "number", "text_list", "number_list", "json"] = "text",
         image_bytes: bytes | None = None,
         alternatives: list | None = None,
         examples: list | None = None,
         use_prompt_config: bool = True,
         max_len: int,
         log_prompt: bool = False,
+        use_cache: bool = True,
         ) -> str:
     
-    if response_type not in ("text", "number", "text_list", "number_list"):
-        raise ValueError(f"Invalid response_type: {response_type}")
-    
-    start_time = time.time()
-
-    if use_prompt_config:
-        system_prompt += (
-            "DO AS YOU ARE TOLD AND RESPOND ONLY WITH WHAT IS ASKED FROM YOU. "
-            "DO NOT EXPLAIN OR SAY WHAT YOU ARE DOING (e.g. here is the..., below is..., sure here is..., etc.). "
-            "DO NOT WRITE ANY SYMBOLS LIKE \\n OR CHANGE LETTER FORMATTING WITH ** AND SIMILAR. "
-            "YOU ARE USED IN A TEXT PROCESSING PYTHON PROGRAM SO THE TEXT SHOULD BE PLAIN. "
-        )
+    request = PromptRequest(
+        system_prompt,
+        user_prompt,
+        response_type=response_type,
+        image_bytes=image_bytes,
+        alternatives=alternatives,
+        examples=examples,
+        use_prompt_config=use_prompt_config,
+        max_len=max_len,
+        use_cache=use_cache
+    )
 
-    if response_type == "number":
-        system_prompt += "RESPOND WITH A SINGLE NUMBER. NO QUOTATION MARKS. NO COMMAS. NO LISTS. "
-    elif response_type == "number_list":
-        system_prompt += "RESPOND WITH A LIST OF NUMBERS SEPARATED BY A COMMA. NOTHING ELSE. "
-
-    if alternatives:
-        enum_arr = []
-        for i, item in enumerate(alternatives):
-            enum_arr.append(f"{i}: {item}")
-        system_prompt += (
-            "HERE IS THE LIST OF NUMBERS YOU CAN CHOSE FROM AND THEIR VALUES: "
-            ", ".join(enum_arr)
-        )
+    llm_reply = request.cached_reply(log_prompt)
+    cached = llm_reply is not None
+    if not cached:
+        response = request.provider.client.chat.completions.create(**request.completion_kwargs())
+        llm_reply = request.read_response(response, log_prompt)
 
-    if examples:
-        examples = ', '.join(map(str, examples))
-        system_prompt += (
-            f"HERE ARE SOME EXAMPLES: {examples}"
-        )
+    return request.parse_and_cache(llm_reply, cached)
 
-    selected_provider  = ""
-    if image_bytes is None:
-        selected_provider = LLM_PROVIDERS["groq"]
-        user_content = user_prompt
-    else:
-        selected_provider = LLM_PROVIDERS["openai"]
-        data_url = f"data:image/png;base64,{base64.b64encode(image_bytes).decode('ascii')}"
-        user_content = [
-                    { "type": "text", "text": user_prompt },
-                    { "type": "image_url", "image_url": { "url": data_url}}
-                ]
-        
-    max_tokens = max_len // 4 if max_len // 4 > 5 else 5
-
-    response = selected_provider.client.chat.completions.create(
-        model=selected_provider.model,
-        messages=[
-            {
-                "role": "system",
-                "content": system_prompt
-            },
-            {
-                "role": "user",
-                "content": user_content
-            }   
-        ],
-        max_tokens=max_tokens,
-        stream=False
+async def prompt_llm_async(
+        system_prompt: str,
+        user_prompt: str,
+        *,
+        response_type: Literal["text", "number", "text_list", "number_list", "json"] = "text",
+        image_bytes: bytes | None = None,
+        alternatives: list | None = None,
+        examples: list | None = None,
+        use_prompt_config: bool = True,
+        max_len: int,
+        log_prompt: bool = False,
+        use_cache: bool = True,
+        ) -> str:
+    """
+    Som prompt_llm, men bruker den asynkrone OpenAI-klienten slik at flere kall kan
+    kjøre samtidig i samme event loop.
+    """
+    request = PromptRequest(
+        system_prompt,
+        user_prompt,
+        response_type=response_type,
+        image_bytes=image_bytes,
+        alternatives=alternatives,
+        examples=examples,
+        use_prompt_config=use_prompt_config,
+        max_len=max_len,
+        use_cache=use_cache
     )
 
-    if not response.choices:
-        raise ValueError("No response from LLM.")
-    
-    llm_reply = response.choices[0].message.content.strip()
-
-    input_cost = selected_provider.estimate_cost(n_tokens=((len(system_prompt) + len(user_prompt))//4), token_type="input")
-    if image_bytes is not None:
-        input_cost += selected_provider.estimate_cost(n_tokens=int(len(base64.b64encode(image_bytes)) // 1000), token_type="input")
-    output_cost = selected_provider.estimate_cost(n_tokens=(len(llm_reply)//4), token_type="output")
-
-    elapsed = time.time() - start_time 
-
-    if log_prompt:
-        print(f"Response took {int(elapsed)} seconds, and cost around {input_cost + output_cost:.6f} USD.")
-        log_prompt_to_file(system_prompt, user_content)
-
-    if alternatives:
-        return alternatives[int(llm_reply.strip())]
-    if response_type == "number":
-        return_type = float if "." in llm_reply else int
-        return return_type(llm_reply.strip())
-    elif response_type in ("number_list", "text_list"):
-        return_type = int if response_type == "number_list" else str
-        return [return_type(num.strip().upper()) for num in llm_reply.split(",")]
-    else:
-        return llm_reply
+    llm_reply = request.cached_reply(log_prompt)
+    cached = llm_reply is not None
+    if not cached:
+        async with request.provider.get_async_limit():
+            response = await request.provider.get_async_client().chat.completions.create(**request.completion_kwargs())
+        llm_reply = request.read_response(response, log_prompt)
+
+    return request.parse_and_cache(llm_reply, cached)
 
 PROMPT_LOG_DIR = Path("prompt_logs")
 
@@ -165,6 +364,9 @@ def log_prompt_to_file(system_prompt: str, user_content: str):
     return path
 
 if __name__ == "__main__":
+    import tkinter as tk
+    from tkinter import filedialog
+
     root = tk.Tk()
     root.withdraw()
 
@@ -0,0 +1,194 @@
+from typing import Literal
+
+# Begge konfigurasjonene i samme tsvector: norsk stemming for norske eksamener, engelsk
+# for engelske, og ord som ikke stemmes likt treffer fortsatt via den andre.
+SEARCH_CONFIGS = ("norwegian", "english")
+
+# Tabell -> tekstkolonner som indekseres
+SEARCH_COLUMNS = {
+    "pdfblock": ("raw_text",),
+    "page": ("ocr_text",),
+    "task": ("task_text", "raw_text"),
+}
+
+# Fremmednøkler som søket (og DB.load_tree) joiner på
+JOIN_INDEXES = {
+    "pdfblock": "page_id",
+    "page": "pdf_id",
+    "pdf": "exam_id",
+    "exam": "subject_id",
+    "task": "exam_id",
+}
+
+SearchKind = Literal["block", "page", "task"]
+
+# Per type: tabell, alias, tekstkolonne for utdrag og join opp til eksamen og emne
+_SEARCH_SOURCES = {
+    "block": (
+        "pdfblock", "b", "b.raw_text",
+        """
+        JOIN page p ON p.id = b.page_id
+        JOIN pdf f ON f.id = p.pdf_id
+        JOIN exam e ON e.id = f.exam_id
+        """,
+        "p.page_number, b.block_number",
+    ),
+    "page": (
+        "page", "p", "p.ocr_text",
+        """
+        JOIN pdf f ON f.id = p.pdf_id
+        JOIN exam e ON e.id = f.exam_id
+        """,
+        "p.page_number, NULL::integer AS block_number",
+    ),
+    "task": (
+        "task", "k", "coalesce(k.task_text, k.raw_text)",
+        """
+        JOIN exam e ON e.id = k.exam_id
+        LEFT JOIN topic kt ON kt.id = k.topic_id
+        """,
+        "k.task_number",
+    ),
+}
+
+
+def _tsvector(columns: tuple[str, ...]) -> str:
+    text = " || ' ' || ".join(f"coalesce({column}, '')" for column in columns)
+    return " || ".join(f"to_tsvector('{config}', {text})" for config in SEARCH_CONFIGS)
+
+
+def _tsquery(param: str) -> str:
+    return " || ".join(f"websearch_to_tsquery('{config}', {param})" for config in SEARCH_CONFIGS)
+
+
+def create_search_indexes(db) -> None:
+    """
+    Legger til search_vector (generert tsvector-kolonne) med GIN-indeks på tekst-tabellene,
+    trigram-indekser på emnekode og -navn, og indekser på fremmednøklene søket joiner på.
+    Kjøres etter at tabellene er opprettet; trygg å kjøre flere ganger.
+    """
+    from psycopg2 import sql
+
+    statements = []
+    for table, columns in SEARCH_COLUMNS.items():
+        statements += [
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            f"GENERATED ALWAYS AS ({_tsvector(columns)}) STORED",
+            f"CREATE INDEX IF NOT EXISTS {table}_search_vector_idx ON {table} USING GIN (search_vector)",
+        ]
+    for table, column in JOIN_INDEXES.items():
+        statements.append(f"CREATE INDEX IF NOT EXISTS {table}_{column}_idx ON {table} ({column})")
+
+    has_trgm = db.query(sql.SQL("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"), [])
+    if has_trgm:
+        statements += [
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            "CREATE INDEX IF NOT EXISTS subject_code_trgm_idx ON subject USING GIN (code gin_trgm_ops)",
+            "CREATE INDEX IF NOT EXISTS subject_name_trgm_idx ON subject USING GIN (name gin_trgm_ops)",
+        ]
+    else:
+        print("pg_trgm is not available, subject filters will scan the subject table. ")
+
+    db.alter_schema(statements)
+
+
+def _like_pattern(value: str) -> str:
+    escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def search(
+    db,
+    query: str,
+    *,
+    kind: SearchKind = "block",
+    subject: str | None = None,
+    topic: str | None = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> dict:
+    """
+    Fulltekstsøk over blokker, sider eller oppgaver, rangert etter ts_rank_cd.
+
+    query tolkes som websearch_to_tsquery ("fourier rekke", "\\"laplace transform\\"",
+    "-python"). subject filtrerer på emnekode eller -navn (delstreng, trigram-indeksert),
+    topic på navnet til emnets kategori (og oppgavens eget tema for kind="task").
+
+    Returnerer {"results": [...], "next_offset": int | None}, der hvert resultat har id,
+    rank, snippet, exam_id, subject_code, subject_name og plassering.
+    """
+    from psycopg2 import sql
+
+    table, alias, text, joins, location = _SEARCH_SOURCES[kind]
+
+    values: list = [query]
+    filters = [f"{alias}.search_vector @@ q.query"]
+    if subject:
+        values.append(_like_pattern(subject))
+        filters.append(f"(s.code ILIKE ${len(values)} OR s.name ILIKE ${len(values)})")
+    if topic:
+        values.append(_like_pattern(topic))
+        topic_filter = f"t.name ILIKE ${len(values)}"
+        if kind == "task":
+            topic_filter = f"({topic_filter} OR kt.name ILIKE ${len(values)})"
+        filters.append(topic_filter)
+
+    # Én rad ekstra avgjør om det finnes en neste side
+    values += [limit + 1, offset]
+    limit_param, offset_param = f"${len(values) - 1}", f"${len(values)}"
+
+    # ts_headline er dyr, så utdraget lages bare for radene på siden
+    query_sql = f"""
+        WITH q AS (SELECT {_tsquery("$1")} AS query),
+        hits AS (
+            SELECT {alias}.id, {text} AS text, {location},
+                   e.id AS exam_id, s.code AS subject_code, s.name AS subject_name,
+                   ts_rank_cd({alias}.search_vector, q.query, 32) AS rank
+            FROM {table} {alias}
+            CROSS JOIN q
+            {joins}
+            LEFT JOIN subject s ON s.id = e.subject_id
+            LEFT JOIN topic t ON t.id = s.topic_id
+            WHERE {" AND ".join(filters)}
+            ORDER BY rank DESC, {alias}.id
+            LIMIT {limit_param} OFFSET {offset_param}
+        )
+        SELECT hits.*, ts_headline('{SEARCH_CONFIGS[0]}', hits.text, q.query, 'MaxFragments=2, MaxWords=20') AS snippet
+        FROM hits CROSS JOIN q
+        ORDER BY hits.rank DESC, hits.id
+    """
+
+    rows = db.query(sql.SQL(query_sql), values)
+    for row in rows:
+        del row["text"]
+
+    return {
+        "results": rows[:limit],
+        "next_offset": offset + limit if len(rows) > limit else None,
+    }
+
+
+def add_search_arguments(parser) -> None:
+    parser.add_argument("query", help="Search text, e.g. 'fourier rekke' or '\"laplace transform\"'")
+    parser.add_argument("--kind", choices=["block", "page", "task"], default="block")
+    parser.add_argument("--subject", help="Filter on subject code or name, e.g. TMA4135")
+    parser.add_argument("--topic", help="Filter on topic name")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--offset", type=int, default=0)
+
+
+def run_search(db, args) -> dict:
+    page = search(
+        db,
+        args.query,
+        kind=args.kind,
+        subject=args.subject,
+        topic=args.topic,
+        limit=args.limit,
+        offset=args.offset,
+    )
+    for row in page["results"]:
+        print(f"{row['rank']:.3f}  {row['subject_code']}  exam {row['exam_id']}  {row['snippet']}")
+    if page["next_offset"] is not None:
+        print(f"More results: --offset {page['next_offset']}")
+    return page
@@ -0,0 +1,242 @@
+import asyncio
+import os
+import re
+
+from prompt_llm import prompt_llm_async
+
+SEGMENTATION_LLM_FALLBACK = os.getenv("SEGMENTATION_LLM_FALLBACK", "1") == "1"
+
+# "Oppgave 3b", "OPPGAVE 3 b)", "Oppgåve 2", "Problem 2 (10 poeng)", "Task 4:", "Spørsmål 1."
+# Nøkkelordet må stå først på linjen, så henvisninger som "se oppgave 2" ikke treffer.
+# Bokstaven må henge på tallet ("3b") eller stå alene før ")", ".", ":", poeng eller
+# linjeslutt ("3 b)"), så "Oppgave 1 i matematikk" og "Problem 2 a function" blir 1 og 2
+HEADER_RE = re.compile(
+    r"^\s*(?:(?i:oppgave|deloppgave|oppgåve|deloppgåve|problem|task|question|exercise|spørsmål)|OPPG\.?|Oppg\.?)"
+    r"\s*(\d{1,2})(?:([a-zæøå])(?![a-zæøå])|\s+([a-zæøå])(?=\s*(?:[).:(\[]|$)))?\s*\)?(.*)$"
+)
+# Uten nøkkelord: "2. (10 poeng)" / "3b) [15%]", bare når poengene står på linjen
+NUMBERED_HEADER_RE = re.compile(r"^\s*(\d{1,2})([a-zæøå])?\s*[.)]\s*(.*)$")
+POINTS_RE = re.compile(
+    r"[(\[]\s*(?:(?i:vekt|weight)\s*:?\s*)?(\d{1,3}(?:[.,]\d+)?)\s*(?i:poeng|points?|pts?|p|%)\s*[)\]]"
+)
+
+
+def parse_header(line: str) -> dict | None:
+    """
+    Tolker en linje som oppgaveoverskrift. Returnerer task_number ("3b"), key for
+    rekkefølge, points (eller None) og strong (med nøkkelord) eller None.
+    """
+    match = HEADER_RE.match(line)
+    strong = match is not None
+    if strong:
+        number, letter, rest = match.group(1), match.group(2) or match.group(3), match.group(4)
+    else:
+        match = NUMBERED_HEADER_RE.match(line)
+        if match is None or not POINTS_RE.search(match.group(3)):
+            return None
+        number, letter, rest = match.group(1), match.group(2), match.group(3)
+
+    number, letter = int(number), letter or ""
+    points = POINTS_RE.search(rest)
+    return {
+        "task_number": f"{number}{letter}",
+        "key": (number, letter),
+        "points": float(points.group(1).replace(",", ".")) if points else None,
+        "strong": strong,
+    }
+
+
+def parse_points(line: str) -> float | None:
+    # Poeng på linjen rett under overskriften, f.eks. egen span "(10 poeng)"
+    points = POINTS_RE.match(line.strip())
+    return float(points.group(1).replace(",", ".")) if points else None
+
+
+def union_bbox(a: list[float] | None, b: list[float] | None) -> list[float] | None:
+    if a is None:
+        return list(b) if b is not None else None
+    if b is None:
+        return a
+    return [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+
+
+class TaskSegmenter:
+    """
+    Deler en eksamen i oppgaver uten LLM-kall per oppgave: hver linje sjekkes mot
+    overskriftsmønstrene (parse_header) i én gjennomgang, så tiden er lineær i antall linjer.
+
+    blocks er (page_number, bbox, text) i lesefølge (Page._blocks er allerede sortert med
+    layout.reading_order), som for ContextSelector. Overskrifter med nøkkelord
+    ("Oppgave 3b") brukes når eksamenen har dem; ellers nummererte linjer med poeng
+    ("2. (10 poeng)"). En overskrift som ikke øker nummeret (gjentatt eller lavere, typisk
+    en henvisning eller en innholdsfortegnelse) forkastes, og siden regnes som tvetydig.
+    Bare tvetydige sider sendes til LLM-en (segment_async), og svaret overstyrer
+    overskriftene på den siden.
+
+    NTNU legger ofte bokmål, nynorsk og engelsk i samme PDF, med nummereringen fra 1 hver
+    gang. Starter første overskrift på en side på nytt på 1 etter at oppgavene har kommet
+    til minst 2, og kommer det en ny oppgave 2 senere, regnes resten av PDF-en som andre
+    språkversjoner av de samme oppgavene.
+    Bare første versjon blir oppgaver; sidene etter står i dropped_pages.
+    """
+
+    def __init__(self, blocks: list[tuple]):
+        pages: dict[int, list[tuple]] = {}
+        for block in blocks:
+            pages.setdefault(block[0], []).append(block)
+
+        # page_number -> [(bbox, linje)] i lesefølge
+        self.lines: dict[int, list[tuple]] = {
+            page_number: [
+                (bbox, line)
+                for _, bbox, text in page_blocks
+                for line in text.splitlines()
+                if line.strip()
+            ]
+            for page_number, page_blocks in sorted(pages.items())
+        }
+        # Alle kandidatoverskrifter, tolket én gang; nøkkelord-overskrifter utkonkurrerer
+        # nummererte linjer hvis eksamenen har minst én
+        self.headers: dict[int, dict[int, dict]] = {
+            page_number: {
+                i: header
+                for i, (_, line) in enumerate(lines)
+                if (header := parse_header(line))
+            }
+            for page_number, lines in self.lines.items()
+        }
+        if any(header["strong"] for headers in self.headers.values() for header in headers.values()):
+            self.headers = {
+                page_number: {i: header for i, header in headers.items() if header["strong"]}
+                for page_number, headers in self.headers.items()
+            }
+        self.ambiguous_pages: set[int] = set()
+        self.dropped_pages: list[int] = []
+
+    def segment(self, overrides: dict[int, dict[int, dict]] | None = None) -> list[dict]:
+        """
+        Oppgavene som {"task_number", "points", "page_number", "bbox", "raw_text", "task_text"}.
+        overrides er page_number -> {linjenummer: header} som erstatter mønstrene for siden.
+        Tekst før første overskrift (forside, instruksjoner) blir ikke en oppgave, og
+        språkversjonene etter den første tas ikke med (dropped_pages).
+        """
+        overrides = overrides or {}
+        self.ambiguous_pages = set()
+        self.dropped_pages = []
+
+        tasks = []
+        current = None
+        last_key = None
+        for page_number, lines in self.lines.items():
+            if page_number in overrides:
+                headers, check_order = overrides[page_number], False
+            else:
+                headers, check_order = self.headers[page_number], True
+
+            first_header = min(headers, default=None)
+            if (
+                first_header is not None and last_key is not None and last_key[0] >= 2
+                and headers[first_header]["key"][0] == 1
+                and self.run_continues(page_number, overrides)
+            ):
+                self.dropped_pages = [p for p in self.lines if p >= page_number]
+                print(f"Task numbering restarts on page {page_number}, treating pages "
+                      f"{self.dropped_pages[0]}-{self.dropped_pages[-1]} as another language version and skipping them. ")
+                break
+
+            for i, (bbox, line) in enumerate(lines):
+                header = headers.get(i)
+                if header and check_order and last_key is not None and header["key"] <= last_key:
+                    self.ambiguous_pages.add(page_number)
+                    header = None
+
+                if header:
+                    current = {
+                        "task_number": header["task_number"],
+                        "points": header["points"],
+                        "page_number": page_number,
+                        "bbox": union_bbox(None, bbox),
+                        "lines": [line],
+                    }
+                    tasks.append(current)
+                    last_key = header["key"]
+                    continue
+
+                if current is None:
+                    continue
+                if current["points"] is None and len(current["lines"]) == 1:
+                    current["points"] = parse_points(line)
+                if page_number == current["page_number"]:
+                    current["bbox"] = union_bbox(current["bbox"], bbox)
+                current["lines"].append(line)
+
+        for task in tasks:
+            lines = task.pop("lines")
+            task["raw_text"] = "\n".join(lines)
+            task["task_text"] = "\n".join(lines[1:]).strip()
+        return tasks
+
+    def run_continues(self, page_number: int, overrides: dict[int, dict[int, dict]]) -> bool:
+        # En ny versjon har også oppgave 2; en henvisning til "Oppgave 1" midt i teksten har ikke det
+        return any(
+            header["key"][0] == 2
+            for later, lines in self.lines.items() if later >= page_number
+            for header in overrides.get(later, self.headers[later]).values()
+        )
+
+    async def ask_llm(self, page_number: int) -> dict[int, dict]:
+        """
+        Overskriftene på én tvetydig side fra LLM-en, som {linjenummer: header}.
+        """
+        lines = self.lines[page_number]
+        reply = await prompt_llm_async(
+            system_prompt=(
+                "The following numbered lines are one page of an exam. "
+                "Find the lines that start a new task, e.g. 'Oppgave 3', 'Problem 2 (10 points)'. "
+                "Sub-questions like 'a)' are part of their task, and references to other tasks are not headers. "
+                'Respond with a JSON object {"headers": [{"line": <line number>, "task_number": "3b", '
+                '"points": <number or null>}]}. '
+            ),
+            user_prompt="\n".join(f"{i}: {line}" for i, (_, line) in enumerate(lines)),
+            response_type="json",
+            max_len=600
+        )
+
+        headers = {}
+        for item in reply.get("headers") or []:
+            try:
+                line = int(item["line"])
+                match = re.fullmatch(r"\s*(\d{1,2})\s*([a-zæøå])?\s*", str(item["task_number"]))
+            except (KeyError, TypeError, ValueError):
+                continue
+            if match is None or not 0 <= line < len(lines):
+                continue
+            points = item.get("points")
+            headers[line] = {
+                "task_number": f"{int(match.group(1))}{match.group(2) or ''}",
+                "key": (int(match.group(1)), match.group(2) or ""),
+                "points": float(points) if isinstance(points, (int, float)) else None,
+                "strong": True,
+            }
+        return headers
+
+    async def segment_async(self, use_llm: bool = SEGMENTATION_LLM_FALLBACK) -> list[dict]:
+        """
+        segment(), og så én gang til med LLM-svaret for sidene som var tvetydige.
+        Feiler LLM-kallet for en side, brukes mønstrene for den siden likevel.
+        """
+        tasks = self.segment()
+        if not use_llm or not self.ambiguous_pages:
+            return tasks
+
+        pages = sorted(self.ambiguous_pages)
+        print(f"Asking the LLM to segment {len(pages)} ambiguous pages: {pages}")
+        replies = await asyncio.gather(*(self.ask_llm(page) for page in pages), return_exceptions=True)
+
+        overrides = {}
+        for page_number, reply in zip(pages, replies):
+            if isinstance(reply, Exception):
+                print(f"Segmentation of page {page_number} failed ({reply!r}), keeping the pattern result. ")
+            else:
+                overrides[page_number] = reply
+        return self.segment(overrides) if overrides else tasks
@@ -0,0 +1,390 @@
+import json
+import os
+import re
+import shutil
+import threading
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+SIMILARITY_DIR = Path(os.getenv("SIMILARITY_DIR", "similarity_index"))
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+HASHING_DIM = 1024
+EMBED_BATCH_SIZE = 64
+SIMILARITY_MIN_CHARS = 40  # kortere blokker (sidetall, overskrifter) indekseres ikke
+
+# Under dette antallet er brute force (én BLAS-multiplikasjon per bit) raskere enn IVF
+IVF_MIN_TRAIN = int(os.getenv("IVF_MIN_TRAIN", 50_000))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", 0))  # 0: nlist / 8
+QUERY_CHUNK_ROWS = 65536  # rader per matrise-multiplikasjon ved brute force
+
+
+class HashingEmbedder:
+    """
+    Fallback uten modell: ord og tegn-trigrammer hashes inn i en fast dimensjon med
+    fortegn, sublineær tf (1 + log) og L2-normalisering. Ingen IDF, siden IDF endres
+    når korpuset vokser, og da måtte alle lagrede vektorer beregnes på nytt.
+    """
+
+    name = f"hashing-{HASHING_DIM}"
+    dim = HASHING_DIM
+
+    def _features(self, text: str) -> list[str]:
+        words = re.findall(r"\w+", text.casefold())
+        trigrams = [f"#{word[i:i + 3]}" for word in words for i in range(max(1, len(word) - 2))]
+        return words + trigrams
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = self._features(text)
+            if not features:
+                continue
+            hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint32, count=len(features))
+            indices = (hashes % self.dim).astype(np.int64)
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+            np.add.at(vectors[row], indices, signs)
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        return normalize(vectors)
+
+
+class SentenceTransformerEmbedder:
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.name = model_name
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = self.model.encode(texts, batch_size=EMBED_BATCH_SIZE, convert_to_numpy=True, normalize_embeddings=True)
+        return vectors.astype(np.float32, copy=False)
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+def get_embedder():
+    """
+    sentence-transformers-modellen hvis pakken er installert, ellers HashingEmbedder.
+    """
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            try:
+                _embedder = SentenceTransformerEmbedder()
+            except ImportError:
+                _embedder = HashingEmbedder()
+        return _embedder
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+
+def top_k(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Indeksene og verdiene til de k største per rad, sortert synkende.
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64), np.empty((scores.shape[0], 0), dtype=np.float32)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1)
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+@contextmanager
+def file_lock(path: Path):
+    """
+    Eksklusiv lås mellom prosesser (ingest-workers skriver til samme indeks).
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class VectorIndex:
+    """
+    Vektorindeks for én type (f.eks. "task" eller "block") på disk:
+
+    - vectors.f32: minnemappet float32-matrise (count x dim), normaliserte vektorer
+    - ids.i64: DB-id per rad
+    - lists.i32: IVF-listen hver rad er lagt i (-1 før IVF er trent)
+    - centroids.npy og meta.json
+
+    Nye vektorer legges til på slutten (add), og får IVF-liste fra de eksisterende
+    sentroidene, så indeksen bygges gradvis uten å beregnes på nytt. IVF trenes (k-means)
+    første gang det finnes IVF_MIN_TRAIN vektorer; før det søkes det brute force.
+    """
+
+    def __init__(self, kind: str, directory: Path = SIMILARITY_DIR, embedder=None):
+        self.kind = kind
+        self.directory = Path(directory) / kind
+        self.embedder = embedder or get_embedder()
+        self._lock = threading.RLock()
+        self._loaded_count = -1
+        self._load()
+
+    # --- lagring ---
+
+    @property
+    def _meta_path(self) -> Path:
+        return self.directory / "meta.json"
+
+    def _read_meta(self) -> dict:
+        if self._meta_path.exists():
+            meta = json.loads(self._meta_path.read_text(encoding="utf-8"))
+            if meta["embedder"] != self.embedder.name or meta["dim"] != self.embedder.dim:
+                raise ValueError(
+                    f"Index in {self.directory} was built with {meta['embedder']} ({meta['dim']} dims), "
+                    f"not {self.embedder.name}. Use another SIMILARITY_DIR or delete the index."
+                )
+            return meta
+        return {"embedder": self.embedder.name, "dim": self.embedder.dim, "count": 0, "nlist": 0}
+
+    def _write_meta(self, meta: dict) -> None:
+        tmp = self._meta_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, self._meta_path)
+
+    def _map(self, name: str, dtype, shape: tuple):
+        path = self.directory / name
+        if not path.exists() or shape[0] == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+    def _load(self) -> None:
+        with self._lock:
+            self.meta = self._read_meta()
+            count, dim = self.meta["count"], self.meta["dim"]
+            if count == self._loaded_count:
+                return
+            self.vectors = self._map("vectors.f32", np.float32, (count, dim))
+            self.ids = self._map("ids.i64", np.int64, (count,))
+            self.lists = self._map("lists.i32", np.int32, (count,))
+            centroids_path = self.directory / "centroids.npy"
+            self.centroids = np.load(centroids_path) if self.meta["nlist"] and centroids_path.exists() else None
+            self._members = None
+            self._loaded_count = count
+
+    def __len__(self) -> int:
+        return self.meta["count"]
+
+    def missing(self, ids: list[int]) -> list[int]:
+        """
+        De av ids som ikke er i indeksen ennå.
+        """
+        self._load()
+        ids = np.asarray(ids, dtype=np.int64)
+        return ids[~np.isin(ids, self.ids)].tolist()
+
+    # --- skriving ---
+
+    def add(self, ids: list[int], texts: list[str]) -> None:
+        """
+        Legger til tekster med DB-id. Vektorene skrives til slutten av filene under
+        fillås, så flere prosesser kan legge til samtidig.
+        """
+        if not ids:
+            return
+        vectors = np.concatenate([
+            self.embedder.embed(texts[i:i + EMBED_BATCH_SIZE])
+            for i in range(0, len(texts), EMBED_BATCH_SIZE)
+        ])
+
+        with self._lock, file_lock(self.directory / ".lock"):
+            meta = self._read_meta()
+            lists = np.full(len(ids), -1, dtype=np.int32)
+            if meta["nlist"]:
+                centroids = np.load(self.directory / "centroids.npy")
+                lists = np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+
+            for name, data in (
+                ("vectors.f32", vectors),
+                ("ids.i64", np.asarray(ids, dtype=np.int64)),
+                ("lists.i32", lists),
+            ):
+                with open(self.directory / name, "ab") as f:
+                    # Rader etter meta["count"] er fra en add som feilet før meta.json ble
+                    # skrevet; de kuttes, ellers havner nye vektorer på feil id
+                    f.truncate(meta["count"] * data[:1].nbytes)
+                    f.write(np.ascontiguousarray(data).tobytes())
+
+            meta["count"] += len(ids)
+            self._write_meta(meta)
+
+            if not meta["nlist"] and meta["count"] >= IVF_MIN_TRAIN:
+                self._load()
+                self._train()
+
+        self._load()
+
+    def train(self, nlist: int | None = None) -> None:
+        """
+        Trener IVF-sentroider (sfærisk k-means på et utvalg) og tildeler alle rader en liste.
+        Kjøres automatisk én gang av add; senere rader tildeles bare nærmeste sentroide.
+        Kan kjøres på nytt for å tilpasse listene til et korpus som har vokst mye.
+        """
+        with self._lock, file_lock(self.directory / ".lock"):
+            self._loaded_count = -1
+            self._load()
+            self._train(nlist)
+
+    def _train(self, nlist: int | None = None, iterations: int = 10, sample_size: int = 65536) -> None:
+        with self._lock:
+            count = len(self)
+            nlist = nlist or max(1, int(np.sqrt(count)))
+            rng = np.random.default_rng(0)
+            sample = self.vectors[np.sort(rng.choice(count, size=min(count, sample_size), replace=False))]
+            centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+
+            for _ in range(iterations):
+                assignment = np.argmax(sample @ centroids.T, axis=1)
+                # Summer per klynge med reduceat over utvalget sortert på klynge
+                order = np.argsort(assignment, kind="stable")
+                used, starts = np.unique(assignment[order], return_index=True)
+                sums = centroids.copy()  # tomme klynger beholder sentroiden sin
+                sums[used] = np.add.reduceat(sample[order], starts, axis=0)
+                centroids = normalize(sums)
+
+            lists = np.empty(count, dtype=np.int32)
+            for start in range(0, count, QUERY_CHUNK_ROWS):
+                chunk = self.vectors[start:start + QUERY_CHUNK_ROWS]
+                lists[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+
+            np.save(self.directory / "centroids.npy", centroids)
+            lists.tofile(self.directory / "lists.i32")
+            meta = self._read_meta()
+            meta["nlist"] = nlist
+            self._write_meta(meta)
+            self._loaded_count = -1
+            self._load()
+
+    # --- søk ---
+
+    def _list_members(self) -> list[np.ndarray]:
+        if self._members is None:
+            # Radene i hver liste i filrekkefølge, så de leses sekvensielt fra disk
+            order = np.argsort(self.lists, kind="stable")
+            bounds = np.searchsorted(self.lists[order], np.arange(len(self.centroids) + 1))
+            self._members = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+        return self._members
+
+    def query_vectors(self, queries: np.ndarray, k: int = 10, nprobe: int | None = None) -> list[list[tuple[int, float]]]:
+        """
+        Cosinus-topp-k for en batch normaliserte spørrevektorer. Returnerer (id, score)
+        per spørring, best først.
+        """
+        self._load()
+        if len(self) == 0:
+            return [[] for _ in range(len(queries))]
+
+        best_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+
+        def merge(query_rows: np.ndarray, rows: np.ndarray, scores: np.ndarray) -> None:
+            # Slår sammen topp-k fra en bit av matrisen med løpende topp-k for spørringene
+            chunk_rows, chunk_scores = top_k(scores, k)
+            all_rows = np.concatenate([best_rows[query_rows], rows[chunk_rows]], axis=1)
+            all_scores = np.concatenate([best_scores[query_rows], chunk_scores], axis=1)
+            keep, best_scores[query_rows] = top_k(all_scores, k)
+            best_rows[query_rows] = np.take_along_axis(all_rows, keep, axis=1)
+
+        every_query = np.arange(len(queries))
+        if self.centroids is None:
+            # Brute force i biter av matrisen
+            for start in range(0, len(self), QUERY_CHUNK_ROWS):
+                chunk = self.vectors[start:start + QUERY_CHUNK_ROWS]
+                merge(every_query, np.arange(start, start + len(chunk)), queries @ chunk.T)
+        else:
+            # IVF: gå gjennom listene i stedet for spørringene, så hver liste leses én gang
+            # og alle spørringene som prober den scores i én multiplikasjon
+            members = self._list_members()
+            nprobe = nprobe or IVF_NPROBE or max(1, len(self.centroids) // 8)
+            probes, _ = top_k(queries @ self.centroids.T, nprobe)
+            for list_number in np.unique(probes):
+                rows = members[list_number]
+                if not len(rows):
+                    continue
+                query_rows = every_query[(probes == list_number).any(axis=1)]
+                merge(query_rows, rows, queries[query_rows] @ self.vectors[rows].T)
+
+        return [
+            [(int(self.ids[row]), float(score)) for row, score in zip(rows, scores) if row >= 0]
+            for rows, scores in zip(best_rows, best_scores)
+        ]
+
+    def query(self, texts: list[str], k: int = 10, nprobe: int | None = None) -> list[list[tuple[int, float]]]:
+        return self.query_vectors(self.embedder.embed(texts), k=k, nprobe=nprobe)
+
+    def similar_to(self, item_id: int, k: int = 10) -> list[tuple[int, float]]:
+        """
+        De k mest like radene til en allerede indeksert id (uten seg selv).
+        """
+        self._load()
+        rows = np.flatnonzero(self.ids == item_id)
+        if not len(rows):
+            return []
+        matches = self.query_vectors(np.asarray(self.vectors[rows[:1]]), k=k + 1)[0]
+        return [(match_id, score) for match_id, score in matches if match_id != item_id][:k]
+
+    def near_duplicates(self, threshold: float = 0.9, k: int = 5, batch_size: int = 1024) -> list[tuple[int, int, float]]:
+        """
+        Par (id_a, id_b, score) med cosinus >= threshold, f.eks. samme oppgave gitt flere år.
+        """
+        self._load()
+        pairs = []
+        for start in range(0, len(self), batch_size):
+            batch = np.asarray(self.vectors[start:start + batch_size])
+            for row, matches in zip(range(start, start + len(batch)), self.query_vectors(batch, k=k + 1)):
+                item_id = int(self.ids[row])
+                pairs += [
+                    (item_id, match_id, score)
+                    for match_id, score in matches
+                    if match_id > item_id and score >= threshold
+                ]
+        return pairs
+
+
+_indexes: dict[str, VectorIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_index(kind: str) -> VectorIndex:
+    with _indexes_lock:
+        if kind not in _indexes:
+            _indexes[kind] = VectorIndex(kind)
+        return _indexes[kind]
+
+def clear_indexes(directory: Path = SIMILARITY_DIR, kind: str | None = None) -> None:
+    """
+    Sletter indeksen for kind, eller alle. Brukes når databasen nullstilles, siden id-ene
+    da begynner på nytt og de lagrede id-ene ville pekt på andre rader.
+    """
+    with _indexes_lock:
+        if kind is None:
+            _indexes.clear()
+            shutil.rmtree(directory, ignore_errors=True)
+        else:
+            _indexes.pop(kind, None)
+            shutil.rmtree(Path(directory) / kind, ignore_errors=True)
@@ -0,0 +1,306 @@
+import heapq
+import json
+import os
+import random
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Literal
+
+SUBJECTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ntnu_emner.json")
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normaliserer emnenavn for oppslag: små bokstaver, NFKC og ett mellomrom mellom ord.
+    """
+    return " ".join(unicodedata.normalize("NFKC", str(name)).casefold().split())
+
+
+class SubjectCatalog:
+    """
+    Emnekatalogen fra ntnu_emner.json, lastet én gang og indeksert i minnet.
+
+    - by_code: Emnekode -> emne
+    - by_name: normalisert Emnenavn -> emne
+    - subjects: liste med alle emner, brukes for O(1) tilfeldig trekk
+    """
+
+    def __init__(self, path: str = SUBJECTS_PATH):
+        self.path = path
+
+        with open(path, encoding="utf-8") as f:
+            self.subjects: list[dict] = json.load(f)
+
+        self.by_code: dict[str, dict] = {}
+        self.by_name: dict[str, dict] = {}
+
+        for subject in self.subjects:
+            code = subject.get("Emnekode")
+            name = subject.get("Emnenavn")
+            if code:
+                self.by_code.setdefault(code.upper(), subject)
+            if name:
+                self.by_name.setdefault(normalize_name(name), subject)
+
+    def __len__(self) -> int:
+        return len(self.subjects)
+
+    def by_subject_code(self, code: str) -> dict | None:
+        return self.by_code.get(str(code).strip().upper())
+
+    def by_subject_name(self, name: str) -> dict | None:
+        return self.by_name.get(normalize_name(name))
+
+    def name_for_code(self, code: str) -> str | None:
+        subject = self.by_subject_code(code)
+        return subject["Emnenavn"] if subject else None
+
+    def code_for_name(self, name: str) -> str | None:
+        subject = self.by_subject_name(name)
+        return subject["Emnekode"] if subject else None
+
+    def sample(
+        self,
+        field: Literal["Emnekode", "Emnenavn", "Sted", "Temaer"],
+        n: int,
+        rng: random.Random | None = None,
+    ) -> list[str]:
+        rng = rng or random
+        n = min(n, len(self.subjects))
+
+        values = []
+        for i in rng.sample(range(len(self.subjects)), n):
+            value = self.subjects[i].get(field)
+            if value is None:
+                continue
+            if isinstance(value, list):
+                continue  # vi vil ikke ha lister i prompt-eksempler
+            values.append(str(value))
+
+        return values
+
+
+_catalog: SubjectCatalog | None = None
+_catalog_lock = threading.RLock()
+
+
+def get_catalog() -> SubjectCatalog:
+    """
+    Returnerer den prosess-globale katalogen, og laster den ved første kall.
+    """
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = SubjectCatalog()
+    return _catalog
+
+
+# Tegn som OCR typisk forveksler. Både katalogkoder og spørringer brettes til samme form,
+# slik at f.eks. "TMA41OO" og "TMA4100" blir like.
+OCR_CONFUSIONS = str.maketrans({
+    "O": "0",
+    "Q": "0",
+    "D": "0",
+    "I": "1",
+    "L": "1",
+    "|": "1",
+    "!": "1",
+    "Z": "2",
+    "S": "5",
+    "G": "6",
+    "B": "8",
+})
+
+
+def clean_code(code: str) -> str:
+    return re.sub(r"[\s\-_.]", "", str(code).upper())
+
+
+def fold_code(code: str) -> str:
+    """
+    Normaliserer en emnekode for fuzzy oppslag: store bokstaver, uten mellomrom/bindestrek
+    og med OCR-forvekslinger slått sammen.
+    """
+    return clean_code(code).translate(OCR_CONFUSIONS)
+
+
+def family_code(code: str) -> str | None:
+    """
+    Emnekoder med "X" foran første siffer (f.eks. IMAX2012) dekker alle campusvariantene
+    (IMAA2012, IMAG2012, IMAT2012). Returnerer den brettede koden på X-form, eller None
+    hvis koden ikke har bokstaver foran et siffer.
+    """
+    code = clean_code(code)
+    m = re.search(r"\d", code)
+    if not m or m.start() == 0:
+        return None
+    i = m.start() - 1
+    return fold_code(code[:i] + "X" + code[i + 1:])
+
+
+def trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, max_distance: int | None = None) -> int:
+    """
+    Levenshtein-avstand. Avbryter tidlig og returnerer max_distance + 1 når avstanden
+    garantert er større enn max_distance.
+    """
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        for j, cb in enumerate(b, start=1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != cb),
+            ))
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class SubjectResolver:
+    """
+    Fuzzy oppslag av OCR-skadde emnekoder og emnenavn mot katalogen.
+
+    Bygger én gang et eksakt oppslag på brettede koder og trigram-indekser over koder og
+    normaliserte navn. Et oppslag henter kandidater fra trigram-postingene og rangerer
+    dem etter redigeringsavstand (koder) eller trigram-likhet (navn).
+    """
+
+    def __init__(self, catalog: SubjectCatalog):
+        self.catalog = catalog
+
+        self._codes: list[str] = list(catalog.by_code)
+        self._folded: list[str] = [fold_code(code) for code in self._codes]
+        self._families: list[str | None] = [family_code(code) for code in self._codes]
+        self._by_folded: dict[str, list[int]] = defaultdict(list)
+        self._code_index: dict[str, list[int]] = defaultdict(list)
+
+        for i, folded in enumerate(self._folded):
+            self._by_folded[folded].append(i)
+            if self._families[i] and self._families[i] != folded:
+                self._by_folded[self._families[i]].append(i)
+            for gram in trigrams(folded):
+                self._code_index[gram].append(i)
+
+        self._names: list[str] = list(catalog.by_name)
+        self._name_grams: list[set[str]] = []
+        self._name_index: dict[str, list[int]] = defaultdict(list)
+
+        for i, name in enumerate(self._names):
+            grams = trigrams(name)
+            self._name_grams.append(grams)
+            for gram in grams:
+                self._name_index[gram].append(i)
+
+    def resolve_code(
+        self,
+        code: str,
+        limit: int = 5,
+        max_distance: int = 2,
+        n_candidates: int = 30,
+    ) -> list[tuple[str, int]]:
+        """
+        Returnerer opptil limit (emnekode, avstand) sortert etter avstand, kun treff med
+        avstand <= max_distance.
+        """
+        folded = fold_code(code)
+        if not folded:
+            return []
+
+        exact = self._by_folded.get(folded)
+        if exact:
+            return [(self._codes[i], 0) for i in exact][:limit]
+
+        # Spørringer på X-form sammenlignes mot X-formen av katalogkodene
+        is_family = family_code(code) == folded
+        grams = trigrams(folded)
+
+        counts: Counter[int] = Counter()
+        for gram in grams:
+            counts.update(self._code_index.get(gram, ()))
+
+        # Hver redigering ødelegger maks 3 trigrammer, så kandidater med færre felles
+        # trigrammer enn dette kan ikke være innenfor max_distance.
+        min_shared = len(grams) - 3 * max_distance - (3 if is_family else 0)
+
+        candidates = [
+            i for i, shared in counts.items()
+            if shared >= min_shared and abs(len(self._folded[i]) - len(folded)) <= max_distance
+        ]
+        candidates = heapq.nlargest(n_candidates, candidates, key=counts.__getitem__)
+
+        matches = []
+        for i in candidates:
+            target = self._families[i] if is_family and self._families[i] else self._folded[i]
+            distance = edit_distance(folded, target, max_distance)
+            if distance <= max_distance:
+                matches.append((self._codes[i], distance))
+
+        matches.sort(key=lambda match: (match[1], match[0]))
+        return matches[:limit]
+
+    def best_code(self, code: str, max_distance: int = 1) -> str | None:
+        """
+        Beste katalogkode for en ekstrahert kode, eller None hvis treffet ikke er entydig.
+        """
+        matches = self.resolve_code(code, limit=2, max_distance=max_distance)
+        if not matches:
+            return None
+        if len(matches) > 1 and matches[0][1] == matches[1][1]:
+            return None
+        return matches[0][0]
+
+    def resolve_name(
+        self,
+        name: str,
+        limit: int = 5,
+        min_similarity: float = 0.5,
+    ) -> list[tuple[str, float]]:
+        """
+        Returnerer opptil limit (Emnenavn, likhet) rangert etter trigram-Jaccard-likhet.
+        """
+        grams = trigrams(normalize_name(name))
+
+        counts: Counter[int] = Counter()
+        for gram in grams:
+            counts.update(self._name_index.get(gram, ()))
+
+        matches = []
+        for i, shared in counts.items():
+            similarity = shared / (len(grams) + len(self._name_grams[i]) - shared)
+            if similarity >= min_similarity:
+                matches.append((self.catalog.by_name[self._names[i]]["Emnenavn"], similarity))
+
+        matches.sort(key=lambda match: -match[1])
+        return matches[:limit]
+
+
+_resolver: SubjectResolver | None = None
+
+
+def get_resolver() -> SubjectResolver:
+    """
+    Returnerer den prosess-globale resolveren, og bygger indeksene ved første kall.
+    """
+    global _resolver
+    if _resolver is None:
+        with _catalog_lock:
+            if _resolver is None:
+                _resolver = SubjectResolver(get_catalog())
+    return _resolver
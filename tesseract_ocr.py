@@ -0,0 +1,153 @@
+import atexit
+import hashlib
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from io import BytesIO
+
+from ocr import OCRBackend
+
+TESSERACT_WORKERS = int(os.getenv("TESSERACT_WORKERS", os.cpu_count() or 2))
+TESSERACT_CACHE_SIZE = int(os.getenv("TESSERACT_CACHE_SIZE", 1024))  # antall bilder
+TESSERACT_LANG = os.getenv("TESSERACT_LANG", "nor+eng")
+
+PIXMAP_MODES = {1: "L", 3: "RGB"}
+
+
+def tesseract_samples(width: int, height: int, n: int, samples: bytes) -> str:
+    """
+    Kjøres i en worker-prosess. Tar rå pixmap-samples direkte (ingen PNG-koding/-dekoding).
+    """
+    # Importeres her slik at foreldreprosessen ikke trenger PIL/pytesseract for å sende jobber
+    import pytesseract
+    from PIL import Image
+
+    image = Image.frombytes(PIXMAP_MODES[n], (width, height), samples)
+    return pytesseract.image_to_string(image)
+
+
+def tesseract_page(image: bytes, lang: str = TESSERACT_LANG) -> dict:
+    """
+    Kjøres i en worker-prosess. OCR av en hel rendret side (PNG) med ord, bbox og
+    Tesseracts konfidens (0-100), på samme form som Vision-resultatene i ocr.py.
+    """
+    import pytesseract
+    from PIL import Image
+
+    data = pytesseract.image_to_data(Image.open(BytesIO(image)), lang=lang, output_type=pytesseract.Output.DICT)
+
+    words, lines, confidences = [], {}, []
+    for i, text in enumerate(data["text"]):
+        conf = float(data["conf"][i])
+        if conf < 0 or not text.strip():
+            continue
+        left, top, width, height = data["left"][i], data["top"][i], data["width"][i], data["height"][i]
+        words.append({"text": text, "bbox": [left, top, left + width, top + height], "conf": conf})
+        lines.setdefault((data["block_num"][i], data["par_num"][i], data["line_num"][i]), []).append(text)
+        confidences.append(conf)
+
+    return {
+        "text": "\n".join(" ".join(line) for line in lines.values()),
+        "words": words,
+        "confidence": sum(confidences) / len(confidences) if confidences else 0.0,
+    }
+
+
+_executor: ProcessPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+def get_tesseract_executor() -> ProcessPoolExecutor:
+    """
+    Prosesspoolen deles av bildeblokk-OCR og side-OCR.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=TESSERACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+def shutdown_tesseract_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(cancel_futures=True)
+            _executor = None
+
+
+class ImageBlockOCR:
+    """
+    Tesseract-OCR av bildeblokker i en prosesspool.
+
+    Jobber nøkles på en hash av bildedataene, så like bilder (logoer, topptekster som går
+    igjen på hver side) bare OCR-es én gang: senere blokker får samme Future.
+    """
+
+    def __init__(self, cache_size: int = TESSERACT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._futures: OrderedDict[str, Future] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, pix) -> Future:
+        """
+        Sender en fitz.Pixmap (grå eller RGB, uten alfa) til OCR og returnerer en Future
+        med teksten.
+        """
+        samples = pix.samples
+        key = hashlib.sha1(samples).hexdigest() + f"_{pix.width}x{pix.height}x{pix.n}"
+
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None:
+                self._futures.move_to_end(key)
+                return future
+
+            future = get_tesseract_executor().submit(tesseract_samples, pix.width, pix.height, pix.n, samples)
+            self._futures[key] = future
+            while len(self._futures) > self.cache_size:
+                self._futures.popitem(last=False)
+        # Utenfor låsen: er jobben allerede ferdig, kjøres callbacken med en gang i denne tråden
+        future.add_done_callback(lambda done: self._evict_failed(key, done))
+        return future
+
+    def _evict_failed(self, key: str, future: Future) -> None:
+        # En feilet jobb skal ikke gjenbrukes; neste blokk med samme bilde prøver på nytt
+        if future.cancelled() or future.exception() is not None:
+            with self._lock:
+                if self._futures.get(key) is future:
+                    del self._futures[key]
+
+
+
+class TesseractOCR(OCRBackend):
+    """
+    Lokal OCR av hele sider i prosesspoolen. Gratis og uten nettverk, men svakere enn
+    Vision på håndskrift, formler og dårlige skann; "confidence" i resultatet brukes av
+    ocr_router til å avgjøre om siden må sendes videre.
+    """
+
+    name = "tesseract"
+
+    def __init__(self, lang: str = TESSERACT_LANG):
+        self.lang = lang
+
+    def _ocr(self, images: list[bytes]) -> list[dict]:
+        executor = get_tesseract_executor()
+        futures = [executor.submit(tesseract_page, image, self.lang) for image in images]
+
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"Error during Tesseract OCR: {e}")
+                results.append({"text": "", "words": [], "confidence": 0.0, "error": str(e)})
+        return results
+
+
+image_block_ocr = ImageBlockOCR()
+atexit.register(shutdown_tesseract_executor)
@@ -0,0 +1,92 @@
+import os
+import re
+
+from subject_catalog import get_catalog
+
+TEXT_QUALITY_THRESHOLD = float(os.getenv("TEXT_QUALITY_THRESHOLD", 0.6))
+MIN_TEXT_CHARS = int(os.getenv("OCR_MIN_TEXT_CHARS", 100))  # bokstaver/tall på en "full" side
+MAX_GARBAGE_RATIO = 0.1
+MIN_CHAR_DENSITY = 0.002  # tegn per pt², vanlig brødtekst ligger rundt 0.01-0.05
+
+# Erstatningstegn, private use-tegn og kontrolltegn: typisk fonter uten ToUnicode-tabell
+GARBAGE_RE = re.compile(r"[\ufffd\ue000-\uf8ff\x00-\x08\x0b\x0c\x0e-\x1f]|\(cid:\d+\)")
+ALNUM_RE = re.compile(r"[^\W_]")
+SUBJECT_CODE_RE = re.compile(r"\b[A-ZÆØÅ]{2,6}\d{3,6}\b")
+
+
+def _area(bbox) -> float:
+    x0, y0, x1, y1 = bbox
+    return abs(x1 - x0) * abs(y1 - y0)
+
+
+def code_hits(text: str) -> int:
+    """
+    Antall forskjellige emnekoder i teksten som finnes i emnekatalogen.
+    """
+    catalog = get_catalog()
+    return len({code for code in SUBJECT_CODE_RE.findall(text.upper()) if code in catalog.by_code})
+
+
+def score_text_layer(blocks, page_area: float) -> dict:
+    """
+    Vurderer PDF-ens eget tekstlag for en side. blocks er (type, bbox, text) fra
+    get_text("dict") (type 0=tekst, 1=bilde).
+
+    Returnerer målene og en samlet score i [0, 1]:
+
+    - coverage: andel av siden dekket av tekstblokker
+    - image_coverage: andel av siden dekket av bilder (skann)
+    - density: bokstaver/tall per pt² tekstblokk, lav ved usynlige eller ødelagte lag
+    - garbage_ratio: andel tegn som er erstatnings-/private use-/kontrolltegn
+    - code_hits: emnekoder fra katalogen, bekrefter at teksten er ekte selv på en kort forside
+    - needs_ocr: om siden bør OCR-es
+    """
+    text_area = image_area = 0.0
+    text_parts = []
+    for block_type, bbox, text in blocks:
+        if block_type == 0:
+            text_area += _area(bbox)
+            text_parts.append(text)
+        elif block_type == 1:
+            image_area += _area(bbox)
+    text = "".join(text_parts)
+
+    page_area = page_area or 1.0
+    coverage = min(1.0, text_area / page_area)
+    image_coverage = min(1.0, image_area / page_area)
+
+    chars = len(ALNUM_RE.findall(text))
+    density = chars / text_area if text_area else 0.0
+    visible = len(text) - text.count(" ") - text.count("\n")
+    garbage_ratio = len(GARBAGE_RE.findall(text)) / visible if visible else 0.0
+    hits = code_hits(text) if chars else 0
+
+    score = (
+        0.4 * min(1.0, chars / MIN_TEXT_CHARS)
+        + 0.3 * min(1.0, coverage / 0.2)
+        + 0.3 * max(0.0, 1.0 - garbage_ratio / MAX_GARBAGE_RATIO)
+    )
+    if hits:
+        score += 0.2
+    if text_area and density < MIN_CHAR_DENSITY:
+        score *= 0.5
+    score = round(min(1.0, score), 3)
+
+    if garbage_ratio > MAX_GARBAGE_RATIO:
+        needs_ocr = True
+    elif image_coverage > 0.5 and coverage < 0.1:
+        needs_ocr = True  # skannet side, eventuelt med litt tekst i topp/bunn
+    elif not image_area and chars < MIN_TEXT_CHARS and not garbage_ratio:
+        needs_ocr = False  # (nesten) tom side uten bilder, ingenting å OCR-e
+    else:
+        needs_ocr = score < TEXT_QUALITY_THRESHOLD
+
+    return {
+        "coverage": round(coverage, 3),
+        "image_coverage": round(image_coverage, 3),
+        "density": round(density, 4),
+        "garbage_ratio": round(garbage_ratio, 3),
+        "code_hits": hits,
+        "score": score,
+        "needs_ocr": needs_ocr,
+    }